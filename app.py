@@ -188,7 +188,11 @@ elif page == "Story Lab":
     if generate_btn and story_idea:
         with st.spinner("Writing your story..."):
             try:
-                story_text = story_generator.generate_story(story_idea)
+                # Show the story as it streams in, then clear it: Step 2 renders the
+                # full text for editing. write_stream returns the full text
+                stream_placeholder = st.empty()
+                story_text = stream_placeholder.write_stream(story_generator.stream_story(story_idea)).strip()
+                stream_placeholder.empty()
                 st.session_state.current_story = story_text
                 st.session_state.current_prompts = None  # Reset prompts
                 st.session_state.generated_images = None  # Reset images
@@ -280,30 +284,19 @@ elif page == "Comic Factory":
                     output_dir = os.path.join(config.COMICS_DIR, comic_id)
                     os.makedirs(output_dir, exist_ok=True)
                     
-                    # Generate images
-                    image_paths = []
+                    # Generate images (panels are requested concurrently)
                     total_panels = len(st.session_state.current_prompts)
+                    status_text.text(f"Generating {total_panels} panels...")
                     
-                    for i, prompt_data in enumerate(st.session_state.current_prompts):
-                        status_text.text(f"Generating Panel {i+1}/{total_panels}...")
-                        progress_bar.progress((i) / total_panels)
-                        
-                        panel_num = prompt_data.get('panel', i+1)
-                        image_prompt = prompt_data.get('image_prompt', '')
-                        dialogue = prompt_data.get('dialogue', '')
-                        
-                        # Generate image
-                        img = comic_renderer.generate_image_from_prompt(image_prompt, panel_num)
-                        
-                        if img:
-                            # Add dialogue
-                            if dialogue:
-                                img = comic_renderer.add_dialogue_overlay(img, dialogue)
-                            
-                            # Save
-                            save_path = os.path.join(output_dir, f"panel_{panel_num}.png")
-                            img.save(save_path)
-                            image_paths.append(save_path)
+                    def update_progress(done, total):
+                        status_text.text(f"Generated Panel {done}/{total}...")
+                        progress_bar.progress(done / total)
+                    
+                    image_paths = comic_renderer.render_comic_panels(
+                        st.session_state.current_prompts,
+                        output_dir,
+                        progress_callback=update_progress
+                    )
                     
                     progress_bar.progress(1.0)
                     status_text.text("All panels generated!")
@@ -417,7 +410,7 @@ elif page == "Story Archive":
     st.title("Story Archive")
     st.markdown("View and manage your comic stories.")
     
-    stories = story_manager.get_all_stories()
+    stories = story_manager.get_all_stories(include_content=True)
     
     if not stories:
         st.info("No stories archived yet. Go to **Story Lab** to create one!")
@@ -503,8 +496,8 @@ elif page == "Image Magic":
                             # Save to temp for download
                             import tempfile
                             temp_dir = tempfile.gettempdir()
-                            img_path = os.path.join(temp_dir, f"magic_{uuid.uuid4().hex[:8]}.png")
-                            img.save(img_path)
+                            img_path = os.path.join(temp_dir, f"magic_{os.urandom(4).hex()}.png")
+                            comic_renderer.save_png(img, img_path)
                             
                             with open(img_path, "rb") as f:
                                 st.download_button(
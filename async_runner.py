@@ -0,0 +1,54 @@
+"""
+Async Runner Module
+Runs coroutines from synchronous code (Streamlit, CLI) on one long-lived event loop
+"""
+import asyncio
+import threading
+
+_LOOP = None
+_LOCK = threading.Lock()
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Start the shared background event loop on first use and return it"""
+    global _LOOP
+    with _LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name="async-runner", daemon=True).start()
+    return _LOOP
+
+def run_sync(coro):
+    """
+    Run a coroutine on the shared loop and block until it finishes.
+    A single loop is reused so async clients (e.g. Gemini's gRPC channel)
+    stay bound to the loop that created them.
+
+    Args:
+        coro: Coroutine to run
+
+    Returns:
+        The coroutine's result (exceptions are re-raised)
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+def iter_sync(agen):
+    """
+    Iterate an async generator from synchronous code, one item at a time,
+    on the shared loop (e.g. to feed streamed text to st.write_stream).
+
+    Args:
+        agen: Async generator
+
+    Yields:
+        Items produced by the async generator
+    """
+    try:
+        while True:
+            try:
+                yield run_sync(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        # Runs the generator's cleanup (e.g. releasing a Gemini slot) even
+        # when the consumer stops early
+        run_sync(agen.aclose())
@@ -3,20 +3,11 @@ Character Manager Module
 Handles character creation, storage, and management
 """
 import os
-import json
-import uuid
 from PIL import Image
-try:
-    import google.generativeai as genai
-except ImportError:
-    genai = None  # Generative AI not available; functions requiring it should handle this case
 import config
-import rag_index
+import fast_json
 import comic_renderer
 
-if genai is not None:
-    genai.configure(api_key=config.GOOGLE_API_KEY)
-
 def add_character_from_images(name: str, role: str, description: str, 
                                image_files: list, age: str = "", 
                                personality: str = "", tags: list = None) -> dict:
@@ -36,7 +27,7 @@ def add_character_from_images(name: str, role: str, description: str,
         Character metadata dictionary
     """
     # Generate character ID
-    char_id = name.lower().replace(" ", "_") + "_" + str(uuid.uuid4())[:8]
+    char_id = f"{name.lower().replace(' ', '_')}_{os.urandom(4).hex()}"
     
     # Create character directory
     char_dir = os.path.join(config.CHARACTERS_DIR, char_id)
@@ -47,14 +38,15 @@ def add_character_from_images(name: str, role: str, description: str,
     for i, img_file in enumerate(image_files):
         img_path = os.path.join(char_dir, f"reference_{i+1}.png")
         
-        # Handle both Streamlit UploadedFile and regular file objects
-        if hasattr(img_file, 'read'):
-            img = Image.open(img_file)
-            img.save(img_path)
+        # PNG uploads (Streamlit UploadedFile) are already in the target
+        # format, so write the bytes as-is instead of decoding and re-encoding
+        if getattr(img_file, 'type', '').endswith('png') and hasattr(img_file, 'getbuffer'):
+            with open(img_path, 'wb') as out:
+                out.write(img_file.getbuffer())
         else:
-            # Direct file path
+            # Other formats, file objects or direct file paths
             img = Image.open(img_file)
-            img.save(img_path)
+            comic_renderer.save_png(img, img_path)
         
         image_paths.append(img_path)
     
@@ -72,11 +64,12 @@ def add_character_from_images(name: str, role: str, description: str,
     
     # Save JSON
     json_path = os.path.join(char_dir, "metadata.json")
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(char_data, f, indent=2)
+    fast_json.dump_file(char_data, json_path)
     
-    # Add to RAG index
-    rag_index.add_character_to_index(char_data, json_path)
+    # Add to RAG index synchronously so a failed write is not reported as success
+    # (imported here: rag_index loads Chroma and the embedding stack)
+    import rag_index
+    rag_index.add_character_to_index(char_data, json_path, background=False)
     
     print(f"[✓] Character '{name}' added successfully with {len(image_paths)} images")
     return char_data
@@ -99,7 +92,7 @@ def add_character_from_description(name: str, role: str, description: str,
         Character metadata dictionary
     """
     # Generate character ID
-    char_id = name.lower().replace(" ", "_") + "_" + str(uuid.uuid4())[:8]
+    char_id = f"{name.lower().replace(' ', '_')}_{os.urandom(4).hex()}"
     
     # Create character directory
     char_dir = os.path.join(config.CHARACTERS_DIR, char_id)
@@ -121,7 +114,7 @@ Full body or upper body shot, clear view of face and outfit.
     
     # Save generated image
     img_path = os.path.join(char_dir, "reference_generated.png")
-    img.save(img_path)
+    comic_renderer.save_png(img, img_path)
     
     # Create metadata
     char_data = {
@@ -138,11 +131,11 @@ Full body or upper body shot, clear view of face and outfit.
     
     # Save JSON
     json_path = os.path.join(char_dir, "metadata.json")
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(char_data, f, indent=2)
+    fast_json.dump_file(char_data, json_path)
     
     # Add to RAG index
-    rag_index.add_character_to_index(char_data, json_path)
+    import rag_index
+    rag_index.add_character_to_index(char_data, json_path, background=False)
     
     print(f"[✓] Character '{name}' created and added successfully")
     return char_data
@@ -153,12 +146,12 @@ def get_character_by_id(char_id: str) -> dict:
     json_path = os.path.join(char_dir, "metadata.json")
     
     if os.path.exists(json_path):
-        with open(json_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return fast_json.load_file(json_path)
     return None
 
 def list_all_characters() -> list:
     """List all characters"""
+    import rag_index
     return rag_index.get_all_characters()
 
 if __name__ == "__main__":
@@ -3,12 +3,143 @@ Comic Renderer Module
 Generates comic panel images using Pollinations API with safety controls
 """
 import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import functools
+import threading
 import requests
 import textwrap
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from PIL import Image, ImageDraw, ImageFont
-from io import BytesIO
 import config
 
+# Shared HTTP session so TCP/TLS connections to Pollinations are reused across
+# panels and comics; transient gateway errors are retried with backoff
+_SESSION = requests.Session()
+_SESSION.headers.update({"Accept-Encoding": "gzip"})
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+))
+
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (5, 90)
+
+# Whitespace normalization for prompts, and the normalized safety suffix whose
+# URL encoding is precomputed in config
+_WS_RE = re.compile(r"\s+")
+_CLEAN_SAFETY_SUFFIX = _WS_RE.sub(" ", config.SAFETY_SUFFIX).strip()
+
+# On-disk cache of generated images keyed by sha1(prompt), LRU-bounded
+_CACHE_DIR = config.PANEL_CACHE_DIR
+_CACHE_MANIFEST = os.path.join(_CACHE_DIR, "manifest.json")
+_CACHE_LOCK = threading.Lock()
+_cache_index = None
+
+def _load_cache_index() -> dict:
+    """Load the {key: last_used} cache manifest (caller holds _CACHE_LOCK)"""
+    global _cache_index
+    if _cache_index is None:
+        try:
+            with open(_CACHE_MANIFEST, 'r', encoding='utf-8') as f:
+                _cache_index = json.load(f)
+        except (OSError, ValueError):
+            _cache_index = {}
+    return _cache_index
+
+def _save_cache_index():
+    """Persist the cache manifest atomically (caller holds _CACHE_LOCK)"""
+    tmp_path = f"{_CACHE_MANIFEST}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_cache_index, f)
+    os.replace(tmp_path, _CACHE_MANIFEST)
+
+def _cache_path(key: str) -> str:
+    return os.path.join(_CACHE_DIR, f"{key}.png")
+
+def _prompt_key(prompt: str) -> tuple:
+    """Return the whitespace-normalized prompt and its cache key"""
+    clean_prompt = _WS_RE.sub(" ", prompt).strip()
+    return clean_prompt, hashlib.sha1(clean_prompt.encode("utf-8")).hexdigest()
+
+def _touch_cache(key: str):
+    """Mark a cache entry as recently used"""
+    with _CACHE_LOCK:
+        index = _load_cache_index()
+        index[key] = time.time()
+        try:
+            _save_cache_index()
+        except OSError:
+            pass
+
+def _load_cached_image(key: str) -> Image.Image:
+    """Return the cached image for key (marking it recently used) or None"""
+    path = _cache_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        img = Image.open(path)
+        img.load()
+    except Exception:
+        return None
+    
+    _touch_cache(key)
+    return img
+
+def _store_in_cache(key: str, stream) -> Image.Image:
+    """
+    Write a downloaded image stream into the cache atomically and decode it.
+    Downloads that are not PNG (Pollinations usually serves JPEG) are
+    re-encoded once here, so every cache entry really is a .png file.
+    Evicts the least recently used entries beyond PANEL_CACHE_MAX_ENTRIES.
+    """
+    os.makedirs(_CACHE_DIR, exist_ok=True)
+    path = _cache_path(key)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    png_tmp_path = f"{tmp_path}.png"
+    
+    try:
+        with open(tmp_path, 'wb', buffering=config.PNG_WRITE_BUFFER) as f:
+            shutil.copyfileobj(stream, f, config.PNG_WRITE_BUFFER)
+        
+        # Validate before publishing so error pages never land in the cache
+        img = Image.open(tmp_path)
+        img.load()
+        if img.format == "PNG":
+            os.replace(tmp_path, path)
+        else:
+            save_png(img, png_tmp_path)
+            os.replace(png_tmp_path, path)
+    finally:
+        for leftover in (tmp_path, png_tmp_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    
+    with _CACHE_LOCK:
+        index = _load_cache_index()
+        index[key] = time.time()
+        
+        excess = len(index) - config.PANEL_CACHE_MAX_ENTRIES
+        if excess > 0:
+            for old_key in sorted(index, key=index.get)[:excess]:
+                index.pop(old_key, None)
+                try:
+                    os.remove(_cache_path(old_key))
+                except OSError:
+                    pass
+        try:
+            _save_cache_index()
+        except OSError as e:
+            print(f"[WARN] Failed to update panel cache manifest: {e}")
+    return img
+
 def generate_image_from_prompt(prompt: str, panel_num: int = 1) -> Image.Image:
     """
     Generate image from prompt using Pollinations API.
@@ -21,20 +152,32 @@ def generate_image_from_prompt(prompt: str, panel_num: int = 1) -> Image.Image:
     Returns:
         PIL Image object or None if failed
     """
-    print(f"[*] Generating Panel {panel_num}...")
-    
     # Sanitize prompt: remove newlines and extra spaces
-    clean_prompt = " ".join(prompt.split())
+    clean_prompt, cache_key = _prompt_key(prompt)
     
-    # Encode prompt for URL
-    import urllib.parse
-    safe_prompt = urllib.parse.quote(clean_prompt)
+    # Identical prompts reuse the previously generated image
+    img = _load_cached_image(cache_key)
+    if img is not None:
+        print(f"[✓] Panel {panel_num} loaded from cache")
+        return img
+    
+    print(f"[*] Generating Panel {panel_num}...")
+    
+    # Encode prompt for URL; the (long) safety suffix is pre-encoded
+    if clean_prompt.endswith(_CLEAN_SAFETY_SUFFIX):
+        body = clean_prompt[:-len(_CLEAN_SAFETY_SUFFIX)]
+        safe_prompt = urllib.parse.quote(body) + config.SAFETY_SUFFIX_URLENC
+    else:
+        safe_prompt = urllib.parse.quote(clean_prompt)
     url = f"{config.POLLINATIONS_API_URL}{safe_prompt}"
     
     try:
-        response = requests.get(url, timeout=90)
-        response.raise_for_status()
-        img = Image.open(BytesIO(response.content))
+        # Stream the response body straight into the cache file instead of
+        # buffering response.content in memory
+        with _SESSION.get(url, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            img = _store_in_cache(cache_key, response.raw)
         print(f"    [✓] Panel {panel_num} generated successfully")
         return img
     except Exception as e:
@@ -42,13 +185,79 @@ def generate_image_from_prompt(prompt: str, panel_num: int = 1) -> Image.Image:
         print(f"    [DEBUG] URL was: {url[:100]}...") # Print start of URL for debug
         return None
 
-def add_dialogue_overlay(image: Image.Image, dialogue: str) -> Image.Image:
+def generate_image_file(prompt: str, dest_path: str, panel_num: int = 1) -> bool:
+    """
+    Generate (or reuse) the image for a prompt and place it at dest_path as PNG.
+    Cache entries are stored as PNG, so the cached file is hard-linked (or
+    copied) into place and a cache hit skips both decoding and re-encoding.
+    
+    Args:
+        prompt: Image generation prompt (already includes safety suffix)
+        dest_path: Destination file path
+        panel_num: Panel number for logging
+    
+    Returns:
+        True if the image was written, False if generation failed
+    """
+    _, cache_key = _prompt_key(prompt)
+    cached_path = _cache_path(cache_key)
+    
+    if os.path.exists(cached_path):
+        _touch_cache(cache_key)
+        print(f"[✓] Panel {panel_num} loaded from cache")
+    elif generate_image_from_prompt(prompt, panel_num) is None:
+        return False
+    
+    try:
+        os.link(cached_path, dest_path)
+    except OSError:
+        try:
+            # Different filesystem (or no hard-link support)
+            shutil.copyfile(cached_path, dest_path)
+        except OSError as e:
+            print(f"    [✗] Panel {panel_num} could not be copied from cache: {e}")
+            return False
+    return True
+
+def save_png(img: Image.Image, path: str):
+    """
+    Save an image as PNG through an explicitly buffered file handle.
+    
+    Args:
+        img: PIL Image
+        path: Destination file path
+    """
+    with open(path, 'wb', buffering=config.PNG_WRITE_BUFFER) as fp:
+        img.save(fp, format='PNG', **config.PNG_FAST_KWARGS)
+
+DIALOGUE_FONT_SIZE = 24
+
+@functools.lru_cache(maxsize=None)
+def _get_font(size: int = DIALOGUE_FONT_SIZE) -> ImageFont.ImageFont:
+    """Load the dialogue font once per size and reuse it for every panel"""
+    try:
+        return ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", size)
+    except:
+        try:
+            return ImageFont.truetype("arial.ttf", size)
+        except:
+            return ImageFont.load_default()
+
+@functools.lru_cache(maxsize=512)
+def _measure(text: str, size: int) -> tuple:
+    """Return the (width, height) of rendered multiline text, cached per text and size"""
+    draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+    bbox = draw.textbbox((0, 0), text, font=_get_font(size))
+    return bbox[2] - bbox[0], bbox[3] - bbox[1]
+
+def add_dialogue_overlay(image: Image.Image, dialogue: str, inplace: bool = False) -> Image.Image:
     """
     Add dialogue text box to comic panel.
     
     Args:
         image: PIL Image
         dialogue: Text to display
+        inplace: Draw directly on `image` instead of on a copy
     
     Returns:
         Image with dialogue overlay
@@ -56,26 +265,18 @@ def add_dialogue_overlay(image: Image.Image, dialogue: str) -> Image.Image:
     if not dialogue or not dialogue.strip():
         return image
     
-    # Create a copy to avoid modifying original
-    img = image.copy()
+    # Work on a copy unless the caller no longer needs the original
+    img = image if inplace else image.copy()
     draw = ImageDraw.Draw(img)
     width, height = img.size
     
-    # Load font
-    try:
-        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 24)
-    except:
-        try:
-            font = ImageFont.truetype("arial.ttf", 24)
-        except:
-            font = ImageFont.load_default()
+    font = _get_font(DIALOGUE_FONT_SIZE)
     
     # Wrap text
     wrapped_text = textwrap.fill(dialogue, width=45)
     
     # Calculate text size
-    bbox = draw.textbbox((0, 0), wrapped_text, font=font)
-    text_w, text_h = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    text_w, text_h = _measure(wrapped_text, DIALOGUE_FONT_SIZE)
     
     # Box dimensions
     padding = 25
@@ -106,42 +307,68 @@ def add_dialogue_overlay(image: Image.Image, dialogue: str) -> Image.Image:
     
     return img
 
-def render_comic_panels(prompts: list, output_dir: str = "comic_output") -> list:
+def _render_panel(prompt_data: dict, panel_num: int, output_dir: str) -> str:
+    """
+    Fetch, overlay and save a single panel.
+    
+    Returns:
+        Saved image path or None if generation failed
+    """
+    img = generate_image_from_prompt(prompt_data.get("image_prompt", ""), panel_num)
+    
+    if not img:
+        print(f"    [✗] Panel {panel_num} skipped due to generation failure")
+        return None
+    
+    # Add dialogue
+    dialogue = prompt_data.get("dialogue", "")
+    if dialogue:
+        img = add_dialogue_overlay(img, dialogue, inplace=True)
+    
+    # Save
+    save_path = os.path.join(output_dir, f"panel_{panel_num}.png")
+    save_png(img, save_path)
+    print(f"    [✓] Saved to {save_path}")
+    return save_path
+
+def render_comic_panels(prompts: list, output_dir: str = "comic_output",
+                        progress_callback=None) -> list:
     """
     Render all comic panels from prompts.
+    Each panel runs its own fetch -> dialogue overlay -> PNG save pipeline in a
+    worker thread, so downloads, drawing and encoding of different panels
+    overlap.
     
     Args:
         prompts: List of prompt dictionaries from prompt_generator
         output_dir: Directory to save images
+        progress_callback: Optional callable(done, total) invoked as panels finish
     
     Returns:
-        List of image file paths
+        List of image file paths in panel order
     """
     os.makedirs(output_dir, exist_ok=True)
-    image_paths = []
     
-    for prompt_data in prompts:
-        panel_num = prompt_data.get("panel", 1)
-        image_prompt = prompt_data.get("image_prompt", "")
-        dialogue = prompt_data.get("dialogue", "")
-        
-        # Generate image
-        img = generate_image_from_prompt(image_prompt, panel_num)
+    if not prompts:
+        return []
+    
+    total = len(prompts)
+    results = [None] * total
+    
+    with ThreadPoolExecutor(max_workers=min(config.NUM_PANELS, total)) as ex:
+        futures = {
+            ex.submit(_render_panel, prompt_data, prompt_data.get("panel", i + 1), output_dir): i
+            for i, prompt_data in enumerate(prompts)
+        }
         
-        if img:
-            # Add dialogue
-            if dialogue:
-                img = add_dialogue_overlay(img, dialogue)
-            
-            # Save
-            save_path = os.path.join(output_dir, f"panel_{panel_num}.png")
-            img.save(save_path)
-            image_paths.append(save_path)
-            print(f"    [✓] Saved to {save_path}")
-        else:
-            print(f"    [✗] Panel {panel_num} skipped due to generation failure")
+        done = 0
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            done += 1
+            if progress_callback:
+                progress_callback(done, total)
     
-    return image_paths
+    return [path for path in results if path]
 
 if __name__ == "__main__":
     # Test
@@ -3,6 +3,7 @@ Configuration module for Gandhinagar Comic AI
 Loads all API keys and constants from environment variables
 """
 import os
+import urllib.parse
 try:
     from dotenv import load_dotenv
     load_dotenv()
@@ -17,6 +18,32 @@ POLLINATIONS_API_URL = os.getenv("POLLINATIONS_API_URL", "https://image.pollinat
 # Model Configuration
 GEMINI_MODEL = "gemini-2.0-flash"
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+COLLECTION_NAME = "gandhinagar_school"
+
+# Gemini rate limiting: concurrent request cap and retry policy for 429/503 errors
+GEMINI_MAX_CONCURRENT = int(os.getenv("GEMINI_MAX_CONCURRENT", "4"))
+GEMINI_MAX_ATTEMPTS = 5
+GEMINI_RETRY_MAX_WAIT = 30
+
+# Embedding device: "auto" picks CUDA (fp16) when available, else CPU.
+# Set to "cpu", "cuda", "cuda:1", "mps", ... to force a device.
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "auto")
+
+# CPU embedding: use the model's INT8-quantized ONNX export (~2x faster inference).
+# Requires sentence-transformers>=3.2 and `pip install optimum[onnxruntime]`;
+# pick the file matching your CPU (model_qint8_avx512_vnni.onnx, model_qint8_arm64.onnx, ...).
+EMBEDDING_QUANTIZED = os.getenv("EMBEDDING_QUANTIZED", "0") == "1"
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+
+# Chroma HNSW index parameters. They only take effect when the collection is
+# created, so delete VECTOR_DB_DIR and re-run injest_data.py after changing them.
+# Embeddings are L2-normalized, so "l2" ranks exactly like "cosine"; keeping it
+# avoids a space mismatch with existing databases. M=8 suits small corpora
+# (< 10k documents) and roughly halves the graph's memory.
+CHROMA_HNSW_SPACE = os.getenv("CHROMA_HNSW_SPACE", "l2")
+CHROMA_HNSW_M = int(os.getenv("CHROMA_HNSW_M", "16"))
+CHROMA_HNSW_EF_CONSTRUCTION = int(os.getenv("CHROMA_HNSW_EF_CONSTRUCTION", "128"))
+CHROMA_HNSW_EF_SEARCH = int(os.getenv("CHROMA_HNSW_EF_SEARCH", "32"))
 
 # Pollinations Safety Suffix
 # This MUST be appended to every image generation prompt
@@ -25,18 +52,44 @@ SAFETY_SUFFIX = (
     "safe for work, no nudity, no sexual content, no gore, no real people, "
     "no copyrighted characters or logos, original characters only, all-ages friendly"
 )
+# URL-encoded once at import; appended as-is to every Pollinations request URL
+SAFETY_SUFFIX_URLENC = urllib.parse.quote(" ".join(SAFETY_SUFFIX.split()))
 
-# Directory Paths
+# Directory Paths (single source for every module and the ingestion script)
 BASE_DIR = "gandhinagar_school_project"
-CHARACTERS_DIR = os.path.join(BASE_DIR, "data", "1_characters", "students")
-IMAGES_DIR = os.path.join(BASE_DIR, "data", "4_images")
+DATA_DIR = os.path.join(BASE_DIR, "data")
+CHARACTER_DATA_DIR = os.path.join(DATA_DIR, "1_characters")
+CHARACTERS_DIR = os.path.join(CHARACTER_DATA_DIR, "students")
+FAMILIES_DIR = os.path.join(DATA_DIR, "2_families")
+LOCATIONS_DIR = os.path.join(DATA_DIR, "3_locations")
+IMAGES_DIR = os.path.join(DATA_DIR, "4_images")
 VECTOR_DB_DIR = os.path.join(BASE_DIR, "vector_db")
 STORIES_DIR = os.path.join(BASE_DIR, "stories")
+STORIES_DB = os.path.join(STORIES_DIR, "stories.db")
 COMICS_DIR = os.path.join(BASE_DIR, "comics")
+PANEL_CACHE_DIR = os.path.join(BASE_DIR, ".panel_cache")
+
+# Retrieved context sent to Gemini: documents whose first DEDUP_PREFIX_CHARS
+# match an earlier one are dropped, and the total is capped at MAX_CONTEXT_CHARS
+MAX_CONTEXT_CHARS = 4000
+CONTEXT_DEDUP_PREFIX_CHARS = 200
+
+# Seconds a cached retrieval result is reused; bounds staleness when another
+# process (e.g. the ingestion script) writes to the shared vector DB
+QUERY_CACHE_TTL = 300
+
+# Story database: synchronous=FULL instead of NORMAL (slower; only needed for power-loss durability)
+STORIES_FSYNC = False
 
 # Comic Generation Settings
 NUM_PANELS = 6
 PANEL_ASPECT_RATIO = "16:9"
+PANEL_CACHE_MAX_ENTRIES = 500
+
+# PNG save settings for panels, reference and temp images: deflate level 1 is
+# several times faster than Pillow's default of 6. Never enable optimize=True.
+PNG_FAST_KWARGS = {"compress_level": 1, "optimize": False}
+PNG_WRITE_BUFFER = 64 * 1024
 
 # Validation
 def validate_config():
@@ -0,0 +1,50 @@
+"""
+Fast JSON Module
+orjson-backed JSON helpers with a stdlib json fallback
+"""
+import json
+try:
+    import orjson
+except ImportError:
+    orjson = None  # orjson not installed; fall back to the stdlib json module
+
+def loads(data):
+    """
+    Parse JSON from str or bytes.
+
+    Args:
+        data: JSON document as str or bytes
+
+    Returns:
+        Parsed Python object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps(obj, indent: bool = False) -> bytes:
+    """
+    Serialize an object to UTF-8 JSON bytes.
+
+    Args:
+        obj: Object to serialize
+        indent: Pretty-print with 2-space indentation
+
+    Returns:
+        UTF-8 encoded JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def load_file(path: str):
+    """Read and parse a JSON file"""
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+def dump_file(obj, path: str, indent: bool = True):
+    """Serialize an object and write it to a JSON file"""
+    with open(path, 'wb') as f:
+        f.write(dumps(obj, indent=indent))
@@ -0,0 +1,86 @@
+"""
+Gemini Client Module
+Rate-limit-aware Gemini calls: exponential backoff on quota/overload errors
+and a process-wide cap on concurrent requests
+"""
+import asyncio
+from google.api_core import exceptions as google_exceptions
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+import config
+import async_runner
+
+# Errors worth retrying: 429 quota exhaustion and 503 overload
+RETRYABLE_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable)
+
+_retry = retry(
+    wait=wait_random_exponential(multiplier=1, max=config.GEMINI_RETRY_MAX_WAIT),
+    stop=stop_after_attempt(config.GEMINI_MAX_ATTEMPTS),
+    retry=retry_if_exception_type(RETRYABLE_ERRORS),
+    reraise=True
+)
+
+# Every Gemini call runs on the async_runner loop, so one semaphore bounds them all
+_SEM = asyncio.Semaphore(config.GEMINI_MAX_CONCURRENT)
+
+def generate(model, *args, **kwargs):
+    """
+    Call model.generate_content from synchronous code with retries and the
+    shared concurrency limit.
+
+    Args:
+        model: genai.GenerativeModel
+        *args, **kwargs: Passed to generate_content
+
+    Returns:
+        GenerateContentResponse
+    """
+    return async_runner.run_sync(generate_async(model, *args, **kwargs))
+
+async def generate_async(model, *args, **kwargs):
+    """
+    Call model.generate_content_async with retries and the shared concurrency limit.
+
+    Args:
+        model: genai.GenerativeModel
+        *args, **kwargs: Passed to generate_content_async
+
+    Returns:
+        AsyncGenerateContentResponse
+    """
+    async with _SEM:
+        return await _generate_with_retry(model, *args, **kwargs)
+
+@_retry
+async def _generate_with_retry(model, *args, **kwargs):
+    return await model.generate_content_async(*args, **kwargs)
+
+async def stream_async(model, *args, **kwargs):
+    """
+    Stream text from model.generate_content_async(stream=True).
+    Retries until the first chunk arrives (rate-limit errors surface there);
+    the concurrency slot is held until the stream ends.
+
+    Args:
+        model: genai.GenerativeModel
+        *args, **kwargs: Passed to generate_content_async
+
+    Yields:
+        Response text chunks in order
+    """
+    async with _SEM:
+        chunks, first = await _open_stream(model, *args, **kwargs)
+        if first:
+            yield first
+        async for chunk in chunks:
+            if chunk.text:
+                yield chunk.text
+
+@_retry
+async def _open_stream(model, *args, **kwargs):
+    """Start a streamed response and read its first non-empty chunk"""
+    response = await model.generate_content_async(*args, stream=True, **kwargs)
+    chunks = response.__aiter__()
+    async for chunk in chunks:
+        if chunk.text:
+            return chunks, chunk.text
+    return chunks, ""
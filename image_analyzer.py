@@ -4,12 +4,22 @@ Handles image analysis, story generation, and image recreation using Gemini Visi
 """
 import os
 from PIL import Image
-import google.generativeai as genai
 import config
+import fast_json
 import comic_renderer
-import rag_index
 
-genai.configure(api_key=config.GOOGLE_API_KEY)
+# google.generativeai is heavy to import, so it is loaded on first use; likewise
+# gemini_client (google.api_core, tenacity) and rag_index (Chroma, embeddings)
+_MODEL = None
+
+def _get_model():
+    """Import and configure Gemini on first use and return the shared model"""
+    global _MODEL
+    if _MODEL is None:
+        import google.generativeai as genai
+        genai.configure(api_key=config.GOOGLE_API_KEY)
+        _MODEL = genai.GenerativeModel(config.GEMINI_MODEL)
+    return _MODEL
 
 def analyze_image(image_file, prompt: str) -> str:
     """
@@ -30,9 +40,10 @@ def analyze_image(image_file, prompt: str) -> str:
             img = image_file
         
         # Use Gemini Vision model
-        model = genai.GenerativeModel(config.GEMINI_MODEL)
+        model = _get_model()
         
-        response = model.generate_content([prompt, img])
+        import gemini_client
+        response = gemini_client.generate(model, [prompt, img])
         return response.text.strip()
     
     except Exception as e:
@@ -108,24 +119,27 @@ Provide a concise summary in 2-3 sentences that could be used to recreate a simi
         
         style_description = analyze_image(image_file, analysis_prompt)
         
+        import rag_index
+        
         # Step 2: Get character descriptions from RAG or File System
         if character_names:
             # Use specified characters
             character_data_list = []
             all_characters = rag_index.get_all_characters() # Cache all characters for fallback
+            by_name = {c.get("name", "").lower(): c for c in all_characters}
+            
+            # Try RAG search first (all names embedded and searched in one batch)
+            results_per_name = rag_index.search_characters_batch(character_names, k=1)
             
-            for name in character_names:
+            for name, results in zip(character_names, results_per_name):
                 found = False
                 
-                # Try RAG search first
-                results = rag_index.search_characters(name, k=1)
                 if results:
                     try:
-                        import json
                         content = results[0].page_content
                         if "Full Data:" in content:
                             json_str = content.split("Full Data:", 1)[1].strip()
-                            char_data = json.loads(json_str)
+                            char_data = fast_json.loads(json_str)
                             # Verify name match to avoid fuzzy mismatch
                             if char_data.get("name", "").lower() == name.lower():
                                 character_data_list.append(char_data)
@@ -136,11 +150,10 @@ Provide a concise summary in 2-3 sentences that could be used to recreate a simi
                 # Fallback: Search in all characters list (File System)
                 if not found:
                     print(f"[INFO] RAG search failed for '{name}', trying file system fallback...")
-                    for char in all_characters:
-                        if char.get("name", "").lower() == name.lower():
-                            character_data_list.append(char)
-                            found = True
-                            break
+                    char = by_name.get(name.lower())
+                    if char:
+                        character_data_list.append(char)
+                        found = True
                 
                 if not found:
                     print(f"[WARN] Character '{name}' not found in DB or files.")
@@ -195,11 +208,10 @@ Indian school setting, school uniforms. {config.SAFETY_SUFFIX}"""
         
         if img:
             import tempfile
-            import uuid
             temp_dir = tempfile.gettempdir()
-            img_filename = f"recreated_{uuid.uuid4().hex[:8]}.png"
+            img_filename = f"recreated_{os.urandom(4).hex()}.png"
             img_path = os.path.join(temp_dir, img_filename)
-            img.save(img_path)
+            comic_renderer.save_png(img, img_path)
             
             return {
                 "description": f"✨ Recreated the image with your characters: {char_names_str}! Based on the original style: {style_description}",
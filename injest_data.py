@@ -1,78 +1,104 @@
 
 import os
-import json
-import chromadb
-from chromadb.config import Settings
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-
-from langchain_core.documents import Document
-import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import config
+import fast_json
 os.environ["CHROMADB_TELEMETRY"] = "False"
 
-def load_json_files(directory):
-    """Load all JSON files from a directory"""
-    documents = []
-    
-    if not os.path.exists(directory):
-        print(f"[WARNING] Directory not found: {directory}")
-        return documents
-    
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith('.json'):
-                filepath = os.path.join(root, file)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        # Convert JSON to text format
-                        name = data.get("name", "Unknown")
-                        content = f"Name: {name}\n" + json.dumps(data, indent=2)
+# File loading is I/O bound, so overlap reads with a thread pool
+LOAD_WORKERS = min(32, (os.cpu_count() or 1) * 4)
 
-                        doc = Document(
-                            page_content=content,
-                            metadata={
-                                "source": filepath,
-                                "type": "character",
-                                "name": data.get("name", "Unknown")
-                            }
-                        )
-                        documents.append(doc)
-                        print(f"   [+] Loaded: {file}")
-                except Exception as e:
-                    print(f"   [ERROR] Failed to load {file}: {e}")
-    
-    return documents
+# Chunks embedded and added to Chroma per batch during ingestion
+INGEST_BATCH_SIZE = 256
 
-def load_text_files(directory):
-    """Load all TXT files from a directory"""
-    documents = []
-    
+def load_json_file(filepath):
+    """
+    Load a single character JSON file as a (char_data, filepath) item for
+    rag_index.add_characters_to_index (None on failure).
+    """
+    try:
+        data = fast_json.load_file(filepath)
+        print(f"   [+] Loaded: {os.path.basename(filepath)}")
+        return data, filepath
+    except Exception as e:
+        print(f"   [ERROR] Failed to load {os.path.basename(filepath)}: {e}")
+        return None
+
+def load_text_file(filepath):
+    """Load a single TXT file as a Document (None on failure)"""
+    from langchain_core.documents import Document
+    
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = f.read()
+            doc = Document(
+                page_content=content,
+                metadata={
+                    "source": filepath,
+                    "type": "text"
+                }
+            )
+            print(f"   [+] Loaded: {os.path.basename(filepath)}")
+            return doc
+    except Exception as e:
+        print(f"   [ERROR] Failed to load {os.path.basename(filepath)}: {e}")
+        return None
+
+def scan_files(directory, extension):
+    """
+    Yield os.DirEntry objects for all files with the given extension under a
+    directory. File/directory checks use the type info from the scan itself;
+    DirEntry.stat() still costs one stat call per file on POSIX (it is cached
+    on the entry, and free on Windows).
+    """
     if not os.path.exists(directory):
         print(f"[WARNING] Directory not found: {directory}")
-        return documents
-    
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith('.txt'):
-                filepath = os.path.join(root, file)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        doc = Document(
-                            page_content=content,
-                            metadata={
-                                "source": filepath,
-                                "type": "text"
-                            }
-                        )
-                        documents.append(doc)
-                        print(f"   [+] Loaded: {file}")
-                except Exception as e:
-                    print(f"   [ERROR] Failed to load {file}: {e}")
-    
-    return documents
+        return
+    
+    stack = [directory]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file() and entry.name.endswith(extension):
+                    yield entry
+
+def iter_documents(items):
+    """
+    Yield (filepath, loader result or None) for (filepath, loader) pairs in order,
+    loading one window of files at a time through the thread pool.
+    """
+    with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as ex:
+        for start in range(0, len(items), INGEST_BATCH_SIZE):
+            window = items[start:start + INGEST_BATCH_SIZE]
+            loaded = ex.map(lambda item: item[1](item[0]), window)
+            yield from zip((filepath for filepath, _ in window), loaded)
+
+def load_manifest(manifest_path):
+    """Load the {path: {mtime, size, sha1}} manifest of already-indexed files"""
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        return fast_json.load_file(manifest_path)
+    except Exception as e:
+        print(f"[WARNING] Ignoring unreadable manifest {manifest_path}: {e}")
+        return {}
+
+def save_manifest(manifest_path, manifest):
+    """Write the manifest atomically"""
+    tmp_path = manifest_path + ".tmp"
+    fast_json.dump_file(manifest, tmp_path)
+    os.replace(tmp_path, manifest_path)
+
+def file_sha1(filepath):
+    """SHA-1 of a file's contents"""
+    h = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b""):
+            h.update(block)
+    return h.hexdigest()
 
 def ingest_gandhinagar_data():
     """Main function to ingest all data into ChromaDB"""
@@ -82,11 +108,11 @@ def ingest_gandhinagar_data():
     print("="*60 + "\n")
     
     # Define paths
-    base_dir = "gandhinagar_school_project"
-    characters_dir = os.path.join(base_dir, "data", "1_characters")
-    families_dir = os.path.join(base_dir, "data", "2_families")
-    locations_dir = os.path.join(base_dir, "data", "3_locations")
-    vector_db_dir = os.path.join(base_dir, "vector_db")
+    base_dir = config.BASE_DIR
+    characters_dir = config.CHARACTER_DATA_DIR
+    families_dir = config.FAMILIES_DIR
+    locations_dir = config.LOCATIONS_DIR
+    vector_db_dir = config.VECTOR_DB_DIR
     
     # Check if base directory exists
     if not os.path.exists(base_dir):
@@ -94,55 +120,126 @@ def ingest_gandhinagar_data():
         print(f"[INFO] Please run setup.py first to create the project structure.")
         return
     
-    # Load all documents
-    print("[*] Loading Character Data...")
-    character_docs = load_json_files(characters_dir)
-    
-    print("\n[*] Loading Family Data...")
-    family_docs = load_text_files(families_dir)
-    
-    print("\n[*] Loading Location Data...")
-    location_docs = load_text_files(locations_dir)
-    
-    # Combine all documents
-    all_documents = character_docs + family_docs + location_docs
+    # Heavy dependencies (torch/transformers/chromadb) are only loaded when
+    # an ingestion actually runs
+    import rag_shared
+    import rag_index
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    
+    # Files already embedded are tracked in a manifest next to the vector DB;
+    # only new or modified files are re-embedded on each run
+    manifest_path = vector_db_dir + "_manifest.json"
+    manifest = load_manifest(manifest_path) if os.path.exists(vector_db_dir) else {}
+    
+    # Collect all source files
+    print("[*] Scanning Data Files...")
+    sources = (
+        [(entry, load_json_file) for entry in scan_files(characters_dir, '.json')] +
+        [(entry, load_text_file) for entry in scan_files(families_dir, '.txt')] +
+        [(entry, load_text_file) for entry in scan_files(locations_dir, '.txt')]
+    )
     
-    if not all_documents:
+    if not sources:
         print("\n[ERROR] No documents found to ingest!")
         return
     
-    print(f"\n[*] Total Documents Loaded: {len(all_documents)}")
+    new_manifest = {}
+    changed = []
+    for dir_entry, loader in sources:
+        filepath = dir_entry.path
+        st = dir_entry.stat()
+        entry = manifest.get(filepath)
+        
+        # mtime + size unchanged: skip without opening the file
+        if entry and entry.get("mtime") == st.st_mtime and entry.get("size") == st.st_size:
+            new_manifest[filepath] = entry
+            continue
+        
+        sha1 = file_sha1(filepath)
+        new_manifest[filepath] = {"mtime": st.st_mtime, "size": st.st_size, "sha1": sha1}
+        
+        # Touched but identical content: only the manifest needs updating
+        if entry and entry.get("sha1") == sha1:
+            continue
+        
+        changed.append((filepath, loader))
+    
+    removed = [path for path in manifest if path not in new_manifest]
+    
+    print(f"[*] Total Files: {len(sources)} "
+          f"({len(changed)} new/modified, {len(removed)} removed)")
+    
+    if not changed and not removed:
+        save_manifest(manifest_path, new_manifest)
+        print("\n[SUCCESS] Vector database is already up to date.")
+        return
     
     # Initialize embeddings (using free HuggingFace embeddings)
     print("\n[*] Initializing Embeddings Model...")
     print("    (First run will download the model - may take a few minutes)")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
+    rag_shared.get_embeddings()
     
     # Split documents if needed (optional for small documents)
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=500,
         chunk_overlap=50
     )
-    split_docs = text_splitter.split_documents(all_documents)
-    print(f"[*] Documents split into {len(split_docs)} chunks")
     
-    # Create or load ChromaDB
-    print(f"\n[*] Creating Vector Database at: {vector_db_dir}")
-    
-    vectorstore = Chroma.from_documents(
-        documents=split_docs,
-        embedding=embeddings,
-        persist_directory=vector_db_dir,
-        collection_name="gandhinagar_school"
-    )
+    # Open (or create) the persistent ChromaDB
+    print(f"\n[*] Updating Vector Database at: {vector_db_dir}")
+    
+    vectorstore = rag_shared.get_vectorstore()
+    
+    # Drop stale chunks for modified and removed files
+    for filepath in [path for path, _ in changed] + removed:
+        vectorstore.delete(where={"source": filepath})
+    
+    # Stream load -> split -> embed/add in fixed-size batches, so only one
+    # batch of chunks is held in memory at a time
+    print("\n[*] Loading and Embedding Changed Documents...")
+    batch = []
+    characters = []
+    total_chunks = 0
+    total_characters = 0
+    for filepath, doc in iter_documents(changed):
+        if doc is None:
+            # Retry on the next run
+            new_manifest.pop(filepath, None)
+            continue
+        
+        if isinstance(doc, tuple):
+            # Kept whole and upserted under the character id, like app-created characters
+            characters.append(doc)
+            if len(characters) >= INGEST_BATCH_SIZE:
+                rag_index.add_characters_to_index(characters, background=False)
+                total_characters += len(characters)
+                characters = []
+            continue
+        
+        batch.extend(text_splitter.split_documents([doc]))
+        if len(batch) >= INGEST_BATCH_SIZE:
+            vectorstore.add_documents(batch)
+            total_chunks += len(batch)
+            batch = []
+    
+    if characters:
+        rag_index.add_characters_to_index(characters, background=False)
+        total_characters += len(characters)
+    
+    if batch:
+        vectorstore.add_documents(batch)
+        total_chunks += len(batch)
+    
+    print(f"[*] Indexed {total_characters} character(s); other documents split into {total_chunks} chunks")
+    
+    save_manifest(manifest_path, new_manifest)
+    rag_shared.clear_query_cache()
     
     print("\n" + "="*60)
     print("  [SUCCESS] Data Ingestion Complete!")
     print("="*60)
     print(f"\n[INFO] Vector database saved to: {vector_db_dir}")
-    print(f"[INFO] Total chunks stored: {len(split_docs)}")
+    print(f"[INFO] Characters indexed: {total_characters}, chunks added: {total_chunks}, files removed: {len(removed)}")
     print("\n[NEXT STEP] You can now query this database!")
     print("            Try running: python query_data.py\n")
 
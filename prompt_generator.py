@@ -3,57 +3,23 @@ Prompt Generator Module
 Converts stories into 6 detailed scene prompts with safety controls
 """
 import json
+import contextlib
 import google.generativeai as genai
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 import config
+import fast_json
+import rag_shared
+import async_runner
+import gemini_client
 
-genai.configure(api_key=config.GOOGLE_API_KEY)
-
-def load_retriever():
-    """Load ChromaDB retriever"""
-    try:
-        embeddings = HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL)
-        vectorstore = Chroma(
-            persist_directory=config.VECTOR_DB_DIR,
-            embedding_function=embeddings,
-            collection_name="gandhinagar_school"
-        )
-        return vectorstore.as_retriever(search_kwargs={"k": 6})
-    except Exception as e:
-        print(f"[WARN] RAG failed: {e}")
-        return None
-
-def generate_comic_prompts(story_text: str) -> list:
-    """
-    Generate 6 detailed scene prompts from a story.
-    
-    Args:
-        story_text: Complete story text
-    
-    Returns:
-        List of 6 prompt dictionaries with scene details
-    """
-    retriever = load_retriever()
-    context = ""
-    
-    # Get character visual details from RAG
-    if retriever:
-        try:
-            docs = retriever.invoke(story_text)
-            context = "\n\n".join([d.page_content for d in docs])
-        except Exception:
-            pass
-    
-    system_prompt = f"""You are an expert comic book art director.
+NO_CONTEXT_FALLBACK = "Use generic school characters and settings."
 
-CHARACTER/SETTING CONTEXT (use for visual consistency):
-{context if context else "Use generic school characters and settings."}
+# Fixed art-director instructions, sent once per model as the system
+# instruction rather than re-sent inside every request. Gemini's explicit
+# context cache needs a far larger prompt than this, but a stable system
+# prefix is what its implicit prefix caching reuses across calls.
+PANEL_DIRECTOR_INSTRUCTION = """You are an expert comic book art director.
 
-STORY:
-{story_text}
-
-TASK: Convert this story into exactly 6 comic panel prompts.
+TASK: Convert the story you are given into exactly 6 comic panel prompts, using the character/setting context for visual consistency.
 
 For EACH panel, provide:
 1. **scene**: What's happening (action, setting)
@@ -71,7 +37,7 @@ CRITICAL SAFETY REQUIREMENTS:
 
 OUTPUT FORMAT (strict JSON):
 [
-  {{
+  {
     "panel": 1,
     "scene": "...",
     "characters": "...",
@@ -79,18 +45,75 @@ OUTPUT FORMAT (strict JSON):
     "camera_angle": "...",
     "emotion": "...",
     "image_prompt": "..."
-  }},
+  },
   ...
 ]"""
 
+# Per-story request, filled with str.format
+COMIC_PROMPTS_TEMPLATE = """CHARACTER/SETTING CONTEXT (use for visual consistency):
+{context}
+
+STORY:
+{story}"""
+
+genai.configure(api_key=config.GOOGLE_API_KEY)
+_MODEL = genai.GenerativeModel(config.GEMINI_MODEL, system_instruction=PANEL_DIRECTOR_INSTRUCTION)
+
+def generate_comic_prompts(story_text: str) -> list:
+    """
+    Generate 6 detailed scene prompts from a story.
+    Synchronous wrapper around generate_comic_prompts_async.
+    
+    Args:
+        story_text: Complete story text
+    
+    Returns:
+        List of 6 prompt dictionaries with scene details
+    """
+    return async_runner.run_sync(generate_comic_prompts_async(story_text))
+
+def stream_comic_prompts(story_text: str):
+    """
+    Stream the raw JSON text of the panel prompts as it is generated.
+    Synchronous wrapper around stream_comic_prompts_async.
+    
+    Args:
+        story_text: Complete story text
+    
+    Yields:
+        JSON text chunks in order
+    """
+    yield from async_runner.iter_sync(stream_comic_prompts_async(story_text))
+
+async def generate_comic_prompts_async(story_text: str) -> list:
+    """
+    Generate 6 detailed scene prompts from a story without blocking the event loop.
+    The streamed JSON is buffered and parsed once, as soon as the closing
+    bracket of the top-level array arrives.
+    
+    Args:
+        story_text: Complete story text
+    
+    Returns:
+        List of 6 prompt dictionaries with scene details
+    """
+    chunks = []
+    prompts = None
+    
     try:
-        model = genai.GenerativeModel(config.GEMINI_MODEL)
-        response = model.generate_content(
-            contents=[{"role": "user", "parts": [system_prompt]}],
-            generation_config={"response_mime_type": "application/json"}
-        )
+        # aclosing ends the stream on early exit, releasing its Gemini concurrency slot
+        async with contextlib.aclosing(stream_comic_prompts_async(story_text)) as stream:
+            async for chunk in stream:
+                chunks.append(chunk)
+                if chunk.rstrip().endswith("]"):
+                    try:
+                        prompts = fast_json.loads("".join(chunks))
+                        break
+                    except ValueError:
+                        pass  # "]" closed a nested value; keep reading
         
-        prompts = json.loads(response.text)
+        if prompts is None:
+            prompts = fast_json.loads("".join(chunks))
         
         # Add safety suffix to each image_prompt
         for prompt in prompts:
@@ -102,6 +125,43 @@ OUTPUT FORMAT (strict JSON):
     except Exception as e:
         raise Exception(f"Prompt generation failed: {e}")
 
+async def stream_comic_prompts_async(story_text: str):
+    """
+    Generate the panel prompts for a story, yielding the JSON text as Gemini streams it.
+    
+    Args:
+        story_text: Complete story text
+    
+    Yields:
+        JSON text chunks in order
+    """
+    request = await _build_prompts_request(story_text)
+    
+    stream = gemini_client.stream_async(
+        _MODEL,
+        contents=[{"role": "user", "parts": [request]}],
+        generation_config={"response_mime_type": "application/json"}
+    )
+    async with contextlib.aclosing(stream):
+        async for text in stream:
+            yield text
+
+async def _build_prompts_request(story_text: str) -> str:
+    """Retrieve character context and build the panel prompt request"""
+    context = ""
+    
+    # Get character visual details from RAG
+    try:
+        docs = await rag_shared.retrieve_async(story_text, k=6)
+        context = rag_shared.build_context(docs)
+    except Exception:
+        pass
+    
+    return COMIC_PROMPTS_TEMPLATE.format(
+        context=context or NO_CONTEXT_FALLBACK,
+        story=story_text
+    )
+
 if __name__ == "__main__":
     # Test
     test_story = "Kabir woke up late. He rushed to school. His teacher was angry."
@@ -2,45 +2,70 @@
 QA Engine Module - OPTIMIZED for Streamlit Cloud
 Handles RAG-based Q&A with character image retrieval
 """
-import json
+import os
+import re
+import asyncio
 import google.generativeai as genai
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 import config
-import streamlit as st
+import fast_json
+import rag_shared
+import async_runner
+import gemini_client
 
 genai.configure(api_key=config.GOOGLE_API_KEY)
+_MODEL = genai.GenerativeModel(config.GEMINI_MODEL)
 
-@st.cache_resource
-def get_embeddings():
-    """Cache the embeddings model to avoid reloading"""
-    return HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL)
+# Phrases that mean the user wants a picture, matched in one pass by a compiled regex
+IMAGE_REQUEST_KEYWORDS = ["picture", "image", "photo", "show me", "give me a picture", "what does", "look like", "give image", "show image"]
+_IMAGE_REQUEST_RE = re.compile("|".join(map(re.escape, IMAGE_REQUEST_KEYWORDS)))
 
-@st.cache_resource
-def get_vectorstore():
-    """Cache the vectorstore to avoid reloading"""
-    try:
-        embeddings = get_embeddings()
-        vectorstore = Chroma(
-            persist_directory=config.VECTOR_DB_DIR,
-            embedding_function=embeddings,
-            collection_name="gandhinagar_school"
-        )
-        return vectorstore
-    except Exception as e:
-        print(f"[WARN] Failed to load vectorstore: {e}")
-        return None
+# Small talk that needs no retrieval (compared after stripping case and punctuation)
+TRIVIAL_QUERIES = {"hi", "hii", "hey", "hello", "yo", "thanks", "thank you", "thx", "ok", "okay", "bye", "help", "cool", "nice"}
+MIN_RETRIEVAL_QUERY_LENGTH = 3
+
+# Prompt templates, filled with str.format per request
+QA_PROMPT_TEMPLATE = """You are the chronicler of the Gandhinagar School Universe.
+    
+CONTEXT FROM DATABASE:
+{context}{image_info}
+
+USER QUESTION: {query}
+
+INSTRUCTIONS:
+1. Answer the question based ONLY on the context provided.
+2. If the user asks for a picture/image/photo and images are being provided (see SYSTEM NOTE), acknowledge this enthusiastically (e.g., "Here is [Name]!" or "Here are your requested characters!").
+3. If the answer is not in the context, say you don't know but suggest creating a character.
+4. Be helpful, fun, and engaging.
+5. Keep the answer concise (2-3 sentences).
 
-def load_retriever():
-    """Load ChromaDB retriever (uses cached vectorstore)"""
-    vectorstore = get_vectorstore()
-    if vectorstore:
-        return vectorstore.as_retriever(search_kwargs={"k": 4})
-    return None
+ANSWER:"""
+
+GROUP_IMAGE_PROMPT_TEMPLATE = "Group scene with {names} from Gandhinagar School. {descriptions}. Indian school setting, all wearing school uniforms. {safety}"
+
+PORTRAIT_PROMPT_TEMPLATE = "Character portrait: {description}. Indian school student in school uniform. Upper body shot, clear face, friendly expression. {safety}"
+
+def _needs_retrieval(query: str) -> bool:
+    """Return False for small talk and inputs too short to search for"""
+    q = query.strip().lower().strip("!?.,")
+    return len(q) >= MIN_RETRIEVAL_QUERY_LENGTH and q not in TRIVIAL_QUERIES
 
 def answer_question(query: str) -> dict:
     """
     Answer a user question using RAG and return answer + images.
+    Synchronous wrapper around answer_question_async.
+    
+    Args:
+        query: User question
+    
+    Returns:
+        Dictionary with 'answer' (str) and 'images' (list of paths)
+    """
+    return async_runner.run_sync(answer_question_async(query))
+
+async def answer_question_async(query: str) -> dict:
+    """
+    Answer a user question using RAG and return answer + images.
+    When an image is requested, it is generated concurrently with the answer.
     
     Args:
         query: User question
@@ -48,71 +73,70 @@ def answer_question(query: str) -> dict:
     Returns:
         Dictionary with 'answer' (str) and 'images' (list of paths)
     """
-    import os
     import comic_renderer
     
-    retriever = load_retriever()
     context = ""
     relevant_images = []
     character_data_list = []
     
-    if retriever:
+    # Check if user is asking for an image/picture
+    is_image_request = _IMAGE_REQUEST_RE.search(query.lower()) is not None
+    
+    # Greetings and very short inputs skip the embedding pass and Chroma query
+    if _needs_retrieval(query):
         try:
-            docs = retriever.invoke(query)
+            docs = await rag_shared.retrieve_async(query, k=4)
             
             # Extract text context and images
-            context_parts = []
             seen_images = set()
             
             for doc in docs:
-                context_parts.append(doc.page_content)
-                
-                # Try to parse metadata from page_content or use doc.metadata
                 try:
+                    # Characters indexed with image_paths in their metadata need no
+                    # parsing unless the full data is used for an image prompt
+                    meta_image_paths = doc.metadata.get("image_paths")
                     char_data = None
                     
-                    # New format: has "Full Data:" marker
-                    if "Full Data:" in doc.page_content:
-                        json_str = doc.page_content.split("Full Data:", 1)[1].strip()
-                        char_data = json.loads(json_str)
-                    # Old format or truncated: use source file from metadata
-                    elif doc.metadata.get("type") == "character" and "source" in doc.metadata:
-                        source_file = doc.metadata["source"]
-                        if os.path.exists(source_file) and source_file.endswith('.json'):
-                            with open(source_file, 'r', encoding='utf-8') as f:
-                                char_data = json.load(f)
+                    if meta_image_paths is None or is_image_request:
+                        # New format: has "Full Data:" marker
+                        if "Full Data:" in doc.page_content:
+                            json_str = doc.page_content.split("Full Data:", 1)[1].strip()
+                            char_data = fast_json.loads(json_str)
+                        # Old format or truncated: use source file from metadata
+                        elif doc.metadata.get("type") == "character" and "source" in doc.metadata:
+                            source_file = doc.metadata["source"]
+                            if os.path.exists(source_file) and source_file.endswith('.json'):
+                                char_data = fast_json.load_file(source_file)
                     
                     if char_data:
                         character_data_list.append(char_data)
+                    
+                    if meta_image_paths is not None:
+                        image_paths = fast_json.loads(meta_image_paths)
+                    else:
+                        image_paths = (char_data or {}).get("image_paths") or []
+                    
+                    for img_path in image_paths:
+                        # Convert relative paths to absolute
+                        if not os.path.isabs(img_path):
+                            img_path = os.path.abspath(img_path)
                         
-                        # Get images if they exist in the data
-                        if "image_paths" in char_data and char_data["image_paths"]:
-                            for img_path in char_data["image_paths"]:
-                                # Convert relative paths to absolute
-                                if not os.path.isabs(img_path):
-                                    img_path = os.path.abspath(img_path)
-                                
-                                if img_path not in seen_images and os.path.exists(img_path):
-                                    relevant_images.append(img_path)
-                                    seen_images.add(img_path)
+                        if img_path not in seen_images and os.path.exists(img_path):
+                            relevant_images.append(img_path)
+                            seen_images.add(img_path)
                 except Exception as e:
                     pass
             
-            context = "\\n\\n".join(context_parts)
+            context = rag_shared.build_context(docs)
             
         except Exception as e:
             print(f"[WARN] Retrieval failed: {e}")
             context = "No specific context found."
 
-    # Check if user is asking for an image/picture
-    image_request_keywords = ["picture", "image", "photo", "show me", "give me a picture", "what does", "look like", "give image", "show image"]
-    is_image_request = any(keyword in query.lower() for keyword in image_request_keywords)
-    
-    # Generate images on-demand if user requests them
+    # Build an image prompt on-demand if user requests images
+    image_prompt = None
     if is_image_request and character_data_list:
         try:
-            print(f"[*] Generating image for query: {query}")
-            
             # Build visual description from retrieved character data
             character_descriptions = []
             character_names = []
@@ -144,54 +168,62 @@ def answer_question(query: str) -> dict:
                 # Create image prompt based on query context
                 if len(character_names) > 1:
                     # Multiple characters - group scene
-                    names_str = ", ".join(character_names)
-                    image_prompt = f"""Group scene with {names_str} from Gandhinagar School. {'; '.join(character_descriptions)}. Indian school setting, all wearing school uniforms. {config.SAFETY_SUFFIX}"""
+                    image_prompt = GROUP_IMAGE_PROMPT_TEMPLATE.format(
+                        names=", ".join(character_names),
+                        descriptions="; ".join(character_descriptions),
+                        safety=config.SAFETY_SUFFIX
+                    )
                 else:
                     # Single character portrait
-                    char_name = character_names[0]
-                    image_prompt = f"""Character portrait: {character_descriptions[0]}. Indian school student in school uniform. Upper body shot, clear face, friendly expression. {config.SAFETY_SUFFIX}"""
-                
-                # Generate image using Pollinations
-                img = comic_renderer.generate_image_from_prompt(image_prompt, panel_num=0)
-                
-                if img:
-                    # Save generated image
-                    import tempfile
-                    import uuid
-                    temp_dir = tempfile.gettempdir()
-                    img_filename = f"qa_generated_{uuid.uuid4().hex[:8]}.png"
-                    img_path = os.path.join(temp_dir, img_filename)
-                    img.save(img_path)
-                    relevant_images.append(img_path)
-                    print(f"[✓] Generated image saved to {img_path}")
+                    image_prompt = PORTRAIT_PROMPT_TEMPLATE.format(
+                        description=character_descriptions[0],
+                        safety=config.SAFETY_SUFFIX
+                    )
+        except Exception as e:
+            print(f"[WARN] Failed to build image prompt: {e}")
+    
+    async def generate_image():
+        """Generate and save the requested image (None if not requested or failed)"""
+        if not image_prompt:
+            return None
+        try:
+            print(f"[*] Generating image for query: {query}")
+            
+            # Generate image using Pollinations (repeat prompts link the cached file)
+            import tempfile
+            temp_dir = tempfile.gettempdir()
+            img_filename = f"qa_generated_{os.urandom(4).hex()}.png"
+            img_path = os.path.join(temp_dir, img_filename)
+            
+            if await asyncio.to_thread(comic_renderer.generate_image_file, image_prompt, img_path, 0):
+                print(f"[✓] Generated image saved to {img_path}")
+                return img_path
         except Exception as e:
             print(f"[WARN] Failed to generate image: {e}")
+        return None
 
     # Generate Answer
-    # Add info about generated images to the prompt
+    # Add info about images that already exist to the prompt; the one being
+    # generated alongside the answer may still fail, so it is not announced
     image_info = ""
     if relevant_images:
         image_info = f"\\n\\n[SYSTEM NOTE: {len(relevant_images)} image(s) have been generated and will be shown to the user below your response.]"
     
-    prompt = f"""You are the chronicler of the Gandhinagar School Universe.
-    
-CONTEXT FROM DATABASE:
-{context}{image_info}
-
-USER QUESTION: {query}
-
-INSTRUCTIONS:
-1. Answer the question based ONLY on the context provided.
-2. If the user asks for a picture/image/photo and images are being provided (see SYSTEM NOTE), acknowledge this enthusiastically (e.g., "Here is [Name]!" or "Here are your requested characters!").
-3. If the answer is not in the context, say you don't know but suggest creating a character.
-4. Be helpful, fun, and engaging.
-5. Keep the answer concise (2-3 sentences).
-
-ANSWER:"""
+    prompt = QA_PROMPT_TEMPLATE.format(context=context, image_info=image_info, query=query)
 
+    # The answer does not depend on the generated image, so run both at once
+    response, generated_image = await asyncio.gather(
+        gemini_client.generate_async(_MODEL, prompt),
+        generate_image(),
+        return_exceptions=True
+    )
+    
+    if isinstance(generated_image, str):
+        relevant_images.append(generated_image)
+    
     try:
-        model = genai.GenerativeModel(config.GEMINI_MODEL)
-        response = model.generate_content(prompt)
+        if isinstance(response, Exception):
+            raise response
         answer = response.text.strip()
         
         return {
@@ -3,117 +3,168 @@ RAG Index Module
 Handles vector-based character search and indexing
 """
 import os
-import json
 import uuid
-try:
-    from langchain_core.documents import Document
-except ImportError:
-    class Document:
-        def __init__(self, page_content: str = "", metadata: dict = None):
-            self.page_content = page_content
-            self.metadata = metadata or {}
-
-try:
-    from langchain_chroma import Chroma
-except ImportError:
-    class Chroma:
-        def __init__(self, persist_directory=None, embedding_function=None, collection_name=None):
-            self.persist_directory = persist_directory
-            self.embedding_function = embedding_function
-            self.collection_name = collection_name
-            self._docs = []
-        def add_documents(self, docs, ids=None):
-            self._docs.extend(docs)
-        def similarity_search(self, query, k=5):
-            return []
-        def delete(self, ids=None):
-            pass
-
-try:
-    from langchain_huggingface import HuggingFaceEmbeddings
-except ImportError:
-    class HuggingFaceEmbeddings:
-        def __init__(self, model_name=None):
-            self.model_name = model_name
-        def embed_documents(self, docs):
-            return []
-        def embed_query(self, query):
-            return []
+import hashlib
+import atexit
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import config
+import fast_json
+import async_runner
+from rag_shared import Document, get_embeddings, get_vectorstore, batch_retrieve, clear_query_cache
 
-def get_vectorstore():
-    """Get or create the vector store"""
-    embeddings = HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL)
+# Largest number of documents sent to Chroma in one add call
+MAX_BATCH_SIZE = 5000
+
+# Threads used to read character metadata files in parallel
+CHARACTER_LOAD_WORKERS = 16
+
+# Searchable text of a character document; "Full Data:" is parsed back by qa_engine/image_analyzer
+CHARACTER_CONTENT_TEMPLATE = (
+    "Name: {name}\n"
+    "Role: {role}\n"
+    "Visual Description: {visual_description}\n"
+    "Personality: {personality_description}\n"
+    "Tags: {tags}\n"
+    "\n"
+    "Full Data:\n"
+    "{full_data}"
+)
+
+# Background index writes: documents are queued and written in batches of up
+# to WRITE_BATCH_SIZE. A lone write is flushed after WRITE_BATCH_MIN_WAIT; when
+# a backlog is building, the writer waits up to WRITE_BATCH_WAIT to fill a batch
+WRITE_BATCH_SIZE = 64
+WRITE_BATCH_MIN_WAIT = 0.05
+WRITE_BATCH_WAIT = 0.5
+
+# Created on the async_runner loop by the first queued write
+_write_queue = None
+_writer_task = None
+_writer_closing = False
+
+def _character_id(char_data: dict, json_path: str) -> str:
+    """
+    Document id for a character: its own id, or one derived from the file path
+    so id-less characters do not overwrite each other on upsert.
+    """
+    if char_data.get("id"):
+        return char_data["id"]
+    path = os.path.normcase(os.path.normpath(json_path))
+    return "char_" + hashlib.sha1(path.encode("utf-8")).hexdigest()[:16]
+
+def _character_document(char_data: dict, json_path: str) -> Document:
+    """Build the searchable RAG document for a character"""
+    name = char_data.get("name", "Unknown")
+    content = CHARACTER_CONTENT_TEMPLATE.format_map({
+        "name": name,
+        "role": char_data.get("role", "Unknown"),
+        "visual_description": char_data.get("visual_description", ""),
+        "personality_description": char_data.get("personality_description", ""),
+        "tags": ", ".join(char_data.get("tags", [])),
+        "full_data": fast_json.dumps(char_data, indent=True).decode("utf-8")
+    })
     
-    vectorstore = Chroma(
-        persist_directory=config.VECTOR_DB_DIR,
-        embedding_function=embeddings,
-        collection_name="gandhinagar_school"
+    return Document(
+        page_content=content,
+        metadata={
+            "source": json_path,
+            "type": "character",
+            "name": name,
+            "character_id": _character_id(char_data, json_path),
+            # Chroma metadata values must be primitives, so the list is JSON-encoded
+            "image_paths": fast_json.dumps(char_data.get("image_paths", [])).decode("utf-8")
+        }
     )
+
+def add_characters_to_index(items: list, background: bool = True):
+    """
+    Add many characters to the RAG index in batched writes.
+    
+    Args:
+        items: List of (char_data, json_path) tuples
+        background: Queue the write and return immediately (call flush_index()
+            to wait for it); False writes before returning
+    """
+    if not items:
+        return
     
-    return vectorstore
+    docs = [_character_document(char_data, json_path) for char_data, json_path in items]
+    ids = [d.metadata["character_id"] for d in docs]
+    
+    if background:
+        _enqueue(docs, ids)
+    else:
+        _write_documents(docs, ids)
+    
+    invalidate_characters_cache()
+    if background:
+        print(f"[✓] Queued {len(docs)} character(s) for the RAG index")
+    else:
+        print(f"[✓] Added {len(docs)} character(s) to RAG index")
 
-def add_character_to_index(char_data: dict, json_path: str):
+def add_character_to_index(char_data: dict, json_path: str, background: bool = True):
     """
     Add a character to the RAG index.
     
     Args:
         char_data: Character metadata dictionary
         json_path: Path to the character JSON file
+        background: Queue the write instead of waiting for it
     """
-    vectorstore = get_vectorstore()
-    
-    # Create searchable content
-    content = f"""Name: {char_data.get('name', 'Unknown')}
-Role: {char_data.get('role', 'Unknown')}
-Visual Description: {char_data.get('visual_description', '')}
-Personality: {char_data.get('personality_description', '')}
-Tags: {', '.join(char_data.get('tags', []))}
+    add_characters_to_index([(char_data, json_path)], background=background)
 
-Full Data:
-{json.dumps(char_data, indent=2)}"""
+def add_stories_to_index(items: list, background: bool = True):
+    """
+    Add many stories to the RAG index in one batched write.
     
-    doc = Document(
-        page_content=content,
-        metadata={
-            "source": json_path,
-            "type": "character",
-            "name": char_data.get("name", "Unknown"),
-            "character_id": char_data.get("id", "unknown")
-        }
-    )
+    Args:
+        items: List of (story_text, metadata) tuples; metadata may be None
+        background: Queue the write instead of waiting for it
+    """
+    if not items:
+        return
+    
+    docs = []
+    for story_text, metadata in items:
+        if metadata is None:
+            metadata = {}
+        
+        # Ensure ID is in metadata for deletion later
+        if "id" not in metadata:
+            metadata["id"] = str(uuid.uuid4())
+            
+        metadata["type"] = "story"
+        metadata["source"] = "user_generated"
+        
+        docs.append(Document(
+            page_content=story_text,
+            metadata=metadata
+        ))
     
-    vectorstore.add_documents([doc])
-    print(f"[✓] Added {char_data.get('name')} to RAG index")
+    # Use the ID as the document ID in Chroma
+    ids = [d.metadata["id"] for d in docs]
+    if background:
+        _enqueue(docs, ids)
+    else:
+        _write_documents(docs, ids)
+    if background:
+        print(f"[✓] Queued {len(docs)} story(s) for the RAG index")
+    else:
+        print(f"[✓] Added {len(docs)} story(s) to RAG index")
 
-def add_story_to_index(story_text: str, metadata: dict = None):
+def add_story_to_index(story_text: str, metadata: dict = None, background: bool = True):
     """
     Add a story to the RAG index.
     
     Args:
         story_text: The full text of the story
         metadata: Optional metadata (date, title, etc.)
+        background: Queue the write instead of waiting for it
     """
-    vectorstore = get_vectorstore()
-    
     if metadata is None:
         metadata = {}
-    
-    # Ensure ID is in metadata for deletion later
-    if "id" not in metadata:
-        metadata["id"] = str(uuid.uuid4())
-        
-    metadata["type"] = "story"
-    metadata["source"] = "user_generated"
-    
-    doc = Document(
-        page_content=story_text,
-        metadata=metadata
-    )
-    
-    # Use the ID as the document ID in Chroma
-    vectorstore.add_documents([doc], ids=[metadata["id"]])
-    print(f"[✓] Added story to RAG index (ID: {metadata['id']})")
+    add_stories_to_index([(story_text, metadata)], background=background)
 
 def delete_document(doc_id: str):
     """
@@ -122,13 +173,118 @@ def delete_document(doc_id: str):
     Args:
         doc_id: The ID of the document to delete
     """
+    # Let queued writes land first so a pending add cannot resurrect the document
+    flush_index()
     vectorstore = get_vectorstore()
     try:
         vectorstore.delete(ids=[doc_id])
+        clear_query_cache()
         print(f"[✓] Deleted document {doc_id} from RAG index")
     except Exception as e:
         print(f"[WARN] Failed to delete document {doc_id}: {e}")
 
+def _write_documents(docs: list, ids: list):
+    """
+    Write documents to Chroma with one batched embedding pass.
+    Uses the low-level upsert, so re-adding an id replaces its entry.
+    """
+    vectorstore = get_vectorstore()
+    if not hasattr(vectorstore, "_collection"):
+        # Fallback store (langchain_chroma not installed) has no raw collection
+        vectorstore.add_documents(docs, ids=ids)
+        clear_query_cache()
+        return
+    
+    collection = vectorstore._collection
+    texts = [d.page_content for d in docs]
+    vectors = get_embeddings().embed_documents(texts)
+    
+    for start in range(0, len(docs), MAX_BATCH_SIZE):
+        end = start + MAX_BATCH_SIZE
+        collection.upsert(
+            ids=ids[start:end],
+            documents=texts[start:end],
+            metadatas=[d.metadata for d in docs[start:end]],
+            embeddings=vectors[start:end]
+        )
+    
+    clear_query_cache()
+
+def _enqueue(docs: list, ids: list):
+    """Hand documents to the background writer without waiting for Chroma"""
+    async_runner.run_sync(_put_documents(list(zip(docs, ids))))
+
+async def _put_documents(items: list):
+    """Queue (doc, id) pairs, starting the writer task on first use (runs on the shared loop)"""
+    global _write_queue, _writer_task
+    if _write_queue is None:
+        _write_queue = asyncio.Queue()
+        _writer_task = asyncio.get_running_loop().create_task(_drain_writes(_write_queue))
+    for item in items:
+        _write_queue.put_nowait(item)
+
+async def _drain_writes(queue: asyncio.Queue):
+    """Background writer: batch queued documents and write them off the loop thread"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        
+        # Adaptive batching: flush a lone write quickly, but let a backlog fill the batch
+        wait = WRITE_BATCH_WAIT if queue.qsize() else WRITE_BATCH_MIN_WAIT
+        deadline = loop.time() + wait
+        
+        while len(batch) < WRITE_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        docs, ids = [d for d, _ in batch], [i for _, i in batch]
+        try:
+            if _writer_closing:
+                # Executor threads are unavailable during interpreter shutdown
+                _write_documents(docs, ids)
+            else:
+                await asyncio.to_thread(_write_documents, docs, ids)
+        except Exception as e:
+            print(f"[WARN] Background index write of {len(batch)} document(s) failed: {e}")
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+def flush_index():
+    """
+    Block until every queued index write has been written to Chroma.
+    Synchronous wrapper around flush_index_async.
+    """
+    if _write_queue is not None:
+        async_runner.run_sync(flush_index_async())
+
+async def flush_index_async():
+    """Wait for every queued index write to be written to Chroma"""
+    if _write_queue is not None:
+        await _write_queue.join()
+
+async def _close_writer():
+    """Flush pending writes and stop the background writer"""
+    global _writer_closing
+    _writer_closing = True
+    await flush_index_async()
+    _writer_task.cancel()
+    try:
+        await _writer_task
+    except asyncio.CancelledError:
+        pass
+
+@atexit.register
+def _flush_on_exit():
+    """Write anything still queued before the interpreter exits"""
+    if _writer_task is not None:
+        async_runner.run_sync(_close_writer())
+
 def search_characters(query: str, k: int = 5) -> list:
     """
     Search for characters by query.
@@ -149,43 +305,110 @@ def search_characters(query: str, k: int = 5) -> list:
         print(f"[WARN] Character search failed: {e}")
         return []
 
+# get_all_characters() result, reused while every character file is unchanged;
+# the generation is bumped by invalidate_characters_cache() so a load that
+# started before an invalidation never stores its (stale) result
+_characters_cache = None
+_characters_cache_key = None
+_characters_generation = 0
+
+def search_characters_batch(queries: list, k: int = 5) -> list:
+    """
+    Search for characters for several queries at once.
+    
+    Args:
+        queries: List of search queries
+        k: Number of results per query
+    
+    Returns:
+        List of document lists, one per query (empty lists on failure)
+    """
+    try:
+        return batch_retrieve(queries, k=k)
+    except Exception as e:
+        print(f"[WARN] Batched character search failed: {e}")
+        return [[] for _ in queries]
+
 def get_all_characters() -> list:
     """
     Get all characters from the database.
+    The result is cached and reloaded only when a character file is added,
+    removed or modified (checked via the (path, mtime, size) of every file).
     
     Returns:
         List of character metadata dictionaries
     """
-    characters = []
+    global _characters_cache, _characters_cache_key
     
-    if not os.path.exists(config.CHARACTERS_DIR):
-        return characters
+    generation = _characters_generation
+    files = _scan_character_files()
+    if not files:
+        return []
     
-    for item_name in os.listdir(config.CHARACTERS_DIR):
-        item_path = os.path.join(config.CHARACTERS_DIR, item_name)
-        
-        # Check if it's a directory (new structure)
-        if os.path.isdir(item_path):
-            json_path = os.path.join(item_path, "metadata.json")
-            if os.path.exists(json_path):
-                try:
-                    with open(json_path, 'r', encoding='utf-8') as f:
-                        char_data = json.load(f)
-                        characters.append(char_data)
-                except Exception as e:
-                    print(f"[WARN] Failed to load {json_path}: {e}")
-        
-        # Check if it's a JSON file (old structure/fallback)
-        elif item_name.endswith('.json'):
+    key = tuple(files)
+    if _characters_cache is not None and _characters_cache_key == key:
+        return list(_characters_cache)
+    
+    characters = _load_all_characters([path for path, _, _ in files])
+    if generation == _characters_generation:
+        _characters_cache = characters
+        _characters_cache_key = key
+    return list(characters)
+
+def invalidate_characters_cache():
+    """Force the next get_all_characters() call to re-read the directory"""
+    global _characters_cache, _characters_generation
+    _characters_generation += 1
+    _characters_cache = None
+
+def _scan_character_files() -> list:
+    """Return (path, mtime_ns, size) for every character metadata file, in directory order"""
+    files = []
+    
+    try:
+        entries = os.scandir(config.CHARACTERS_DIR)
+    except FileNotFoundError:
+        return []
+    
+    with entries:
+        for entry in entries:
             try:
-                with open(item_path, 'r', encoding='utf-8') as f:
-                    char_data = json.load(f)
-                    characters.append(char_data)
-            except Exception as e:
-                print(f"[WARN] Failed to load {item_name}: {e}")
+                # Directory (new structure) or JSON file (old structure/fallback)
+                if entry.is_dir():
+                    path = os.path.join(entry.path, "metadata.json")
+                    st = os.stat(path)
+                elif entry.name.endswith('.json'):
+                    path = entry.path
+                    st = entry.stat()
+                else:
+                    continue
+            except FileNotFoundError:
+                continue  # Character folder without metadata.json
+            files.append((path, st.st_mtime_ns, st.st_size))
+    
+    return files
+
+def _load_all_characters(paths: list) -> list:
+    """Read the given character metadata files"""
+    if not paths:
+        return []
+    
+    # Reads are I/O-bound, so a thread pool overlaps them; map keeps directory order
+    with ThreadPoolExecutor(max_workers=min(CHARACTER_LOAD_WORKERS, len(paths))) as ex:
+        characters = [char_data for char_data in ex.map(_load_character_file, paths) if char_data is not None]
     
     return characters
 
+def _load_character_file(json_path: str):
+    """Parse one character metadata file, returning None if it is missing or invalid"""
+    try:
+        return fast_json.load_file(json_path)
+    except FileNotFoundError:
+        return None  # Character folder without metadata.json
+    except Exception as e:
+        print(f"[WARN] Failed to load {json_path}: {e}")
+        return None
+
 if __name__ == "__main__":
     # Test
     results = search_characters("student")
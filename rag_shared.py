@@ -0,0 +1,257 @@
+"""
+RAG Shared Module
+Process-wide embedding model, vector store and retrievers shared by all modules
+"""
+import os
+import time
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    class Document:
+        def __init__(self, page_content: str = "", metadata: dict = None):
+            self.page_content = page_content
+            self.metadata = metadata or {}
+
+try:
+    from langchain_chroma import Chroma
+except ImportError:
+    class Chroma:
+        def __init__(self, persist_directory=None, embedding_function=None, collection_name=None, collection_metadata=None):
+            self.persist_directory = persist_directory
+            self.embedding_function = embedding_function
+            self.collection_name = collection_name
+            self._docs = []
+        def add_documents(self, docs, ids=None):
+            self._docs.extend(docs)
+        def similarity_search(self, query, k=5):
+            return []
+        def delete(self, ids=None, **kwargs):
+            pass
+
+try:
+    from langchain_huggingface import HuggingFaceEmbeddings
+except ImportError:
+    class HuggingFaceEmbeddings:
+        def __init__(self, model_name=None, model_kwargs=None, encode_kwargs=None):
+            self.model_name = model_name
+        def embed_documents(self, docs):
+            return []
+        def embed_query(self, query):
+            return []
+import config
+
+# Retrieved documents per (query, k), so repeated questions skip embedding + search
+QUERY_CACHE_SIZE = 256
+_QUERY_CACHE = OrderedDict()
+_QUERY_CACHE_LOCK = threading.Lock()
+
+# Written by injest_data.py after every ingestion run; a changed mtime means
+# another process updated the index, so cached results are dropped
+_INGEST_MANIFEST = config.VECTOR_DB_DIR + "_manifest.json"
+_query_cache_version = None
+
+def _cuda_available() -> bool:
+    try:
+        import torch
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+def embedding_device() -> str:
+    """Resolve config.EMBEDDING_DEVICE ("auto" means CUDA if available, else CPU)"""
+    if config.EMBEDDING_DEVICE == "auto":
+        return "cuda" if _cuda_available() else "cpu"
+    return config.EMBEDDING_DEVICE
+
+def embedding_model_kwargs() -> dict:
+    """
+    SentenceTransformer kwargs for the embedding model.
+    Uses fp16 weights on CUDA. On CPU, uses the model's pre-quantized INT8
+    ONNX export when EMBEDDING_QUANTIZED is set (needs optimum[onnxruntime]),
+    otherwise fp32 PyTorch.
+    """
+    device = embedding_device()
+    if device.startswith("cuda"):
+        import torch
+        return {"device": device, "model_kwargs": {"torch_dtype": torch.float16}}
+    
+    if device != "cpu":
+        return {"device": device}
+    
+    if config.EMBEDDING_QUANTIZED:
+        return {
+            "device": "cpu",
+            "backend": "onnx",
+            "model_kwargs": {"file_name": config.EMBEDDING_ONNX_FILE}
+        }
+    return {"device": "cpu"}
+
+@functools.lru_cache(maxsize=1)
+def get_embeddings():
+    """Load the embedding model once per process"""
+    model_kwargs = embedding_model_kwargs()
+    return HuggingFaceEmbeddings(
+        model_name=config.EMBEDDING_MODEL,
+        model_kwargs=model_kwargs,
+        encode_kwargs={
+            "batch_size": 128 if model_kwargs["device"].startswith("cuda") else 64,
+            "normalize_embeddings": True,
+            "convert_to_numpy": True
+        }
+    )
+
+def hnsw_metadata() -> dict:
+    """HNSW index settings applied when the Chroma collection is created"""
+    return {
+        "hnsw:space": config.CHROMA_HNSW_SPACE,
+        "hnsw:M": config.CHROMA_HNSW_M,
+        "hnsw:construction_ef": config.CHROMA_HNSW_EF_CONSTRUCTION,
+        "hnsw:search_ef": config.CHROMA_HNSW_EF_SEARCH
+    }
+
+@functools.lru_cache(maxsize=1)
+def get_vectorstore():
+    """Open the persistent Chroma collection once per process"""
+    return Chroma(
+        persist_directory=config.VECTOR_DB_DIR,
+        embedding_function=get_embeddings(),
+        collection_name=config.COLLECTION_NAME,
+        collection_metadata=hnsw_metadata()
+    )
+
+def load_retriever(k: int = 5):
+    """
+    Get a retriever over the shared vector store.
+
+    Args:
+        k: Number of documents to retrieve per query
+
+    Returns:
+        Retriever, or None if the vector store is unavailable
+    """
+    try:
+        return get_vectorstore().as_retriever(search_kwargs={"k": k})
+    except Exception as e:
+        print(f"[WARN] RAG retriever failed: {e}")
+        return None
+
+def _query_key(query: str, k: int) -> tuple:
+    """Compact cache key for a (possibly long) query"""
+    return hashlib.blake2b(query.strip().encode("utf-8"), digest_size=16).digest(), k
+
+def _index_version():
+    """mtime of the ingestion manifest, or None if no ingestion has run"""
+    try:
+        return os.stat(_INGEST_MANIFEST).st_mtime_ns
+    except OSError:
+        return None
+
+async def retrieve_async(query: str, k: int = 5) -> list:
+    """
+    Retrieve documents for a query, reusing results for repeated queries.
+    Results are kept in an LRU cache of QUERY_CACHE_SIZE entries. Writes in
+    this process clear it (see clear_query_cache); it is also cleared when an
+    ingestion run elsewhere updates the manifest, and entries expire after
+    QUERY_CACHE_TTL seconds to cover any other out-of-process write.
+    
+    Args:
+        query: Query text
+        k: Number of documents to retrieve
+    
+    Returns:
+        List of Documents (empty if the vector store is unavailable)
+    """
+    global _query_cache_version
+    key = _query_key(query, k)
+    version = _index_version()
+    with _QUERY_CACHE_LOCK:
+        if version != _query_cache_version:
+            _QUERY_CACHE.clear()
+            _query_cache_version = version
+        
+        entry = _QUERY_CACHE.get(key)
+        if entry is not None:
+            cached_at, docs = entry
+            if time.monotonic() - cached_at < config.QUERY_CACHE_TTL:
+                _QUERY_CACHE.move_to_end(key)
+                return list(docs)
+            del _QUERY_CACHE[key]
+    
+    retriever = load_retriever(k=k)
+    if retriever is None:
+        return []
+    docs = await retriever.ainvoke(query)
+    
+    with _QUERY_CACHE_LOCK:
+        _QUERY_CACHE[key] = (time.monotonic(), tuple(docs))
+        if len(_QUERY_CACHE) > QUERY_CACHE_SIZE:
+            _QUERY_CACHE.popitem(last=False)
+    return list(docs)
+
+def build_context(docs: list, max_chars: int = config.MAX_CONTEXT_CHARS) -> str:
+    """
+    Join retrieved documents into a prompt context, skipping near-duplicates
+    (same leading text) and stopping once max_chars would be exceeded.
+    The first document is always kept.
+    
+    Args:
+        docs: Retrieved Documents, most relevant first
+        max_chars: Upper bound on the joined context length
+    
+    Returns:
+        Context string ("" if there are no documents)
+    """
+    seen = set()
+    parts = []
+    total = 0
+    
+    for doc in docs:
+        prefix = doc.page_content[:config.CONTEXT_DEDUP_PREFIX_CHARS]
+        if prefix in seen:
+            continue
+        
+        size = len(doc.page_content) + (2 if parts else 0)
+        if parts and total + size > max_chars:
+            break
+        
+        seen.add(prefix)
+        parts.append(doc.page_content)
+        total += size
+    
+    return "\n\n".join(parts)
+
+def clear_query_cache():
+    """Drop cached retrieval results (call after adding or deleting documents)"""
+    with _QUERY_CACHE_LOCK:
+        _QUERY_CACHE.clear()
+
+def batch_retrieve(queries: list, k: int = 6) -> list:
+    """
+    Retrieve documents for many queries with one batched embedding pass and
+    a single Chroma query.
+
+    Args:
+        queries: List of query strings
+        k: Number of documents to retrieve per query
+
+    Returns:
+        List of Document lists, one per query, in query order
+    """
+    if not queries:
+        return []
+
+    vectors = get_embeddings().embed_documents(list(queries))
+    result = get_vectorstore()._collection.query(
+        query_embeddings=vectors,
+        n_results=k,
+        include=["documents", "metadatas"]
+    )
+
+    return [
+        [Document(page_content=text, metadata=metadata or {}) for text, metadata in zip(texts, metadatas)]
+        for texts, metadatas in zip(result["documents"], result["metadatas"])
+    ]
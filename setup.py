@@ -1,11 +1,22 @@
 import os
-import json
 import sys
+import fast_json
 
 # Fix Windows encoding issues
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8')
 
+def _write_file(item):
+    """Encode one data file up front and write it with a single write call"""
+    filepath, content, ftype = item
+    if ftype == "json":
+        data = fast_json.dumps(content, indent=True)
+    else:
+        data = content.encode('utf-8')
+    with open(filepath, 'wb') as f:
+        f.write(data)
+    return filepath
+
 def create_gandhinagar_project():
     # 1. Define the Root Directory
     root_dir = "gandhinagar_school_project"
@@ -122,12 +133,8 @@ tiktoken
     ]
 
     print("\n[*] Writing Data Files...")
-    for filepath, content, ftype in files_to_create:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            if ftype == "json":
-                json.dump(content, f, indent=2)
-            else:
-                f.write(content)
+    for item in files_to_create:
+        filepath = _write_file(item)
         print(f"   [+] Created File: {filepath}")
 
     # 6. Create Placeholder Images (Empty files just to hold the spot)
@@ -2,56 +2,26 @@
 Story Generator Module
 Generates complete stories from short user ideas using Gemini + RAG
 """
+import contextlib
 import google.generativeai as genai
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 import config
+import rag_shared
+import async_runner
+import gemini_client
 
 # Configure Gemini
 genai.configure(api_key=config.GOOGLE_API_KEY)
+_MODEL = genai.GenerativeModel(config.GEMINI_MODEL)
 
-def load_retriever():
-    """Load ChromaDB retriever for character context"""
-    try:
-        embeddings = HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL)
-        vectorstore = Chroma(
-            persist_directory=config.VECTOR_DB_DIR,
-            embedding_function=embeddings,
-            collection_name="gandhinagar_school"
-        )
-        return vectorstore.as_retriever(search_kwargs={"k": 5})
-    except Exception as e:
-        print(f"[WARN] RAG retriever failed: {e}")
-        return None
+NO_CONTEXT_FALLBACK = "Use generic school characters and settings."
 
-def generate_story(story_idea: str) -> str:
-    """
-    Generate a complete, safe story from a short idea.
-    
-    Args:
-        story_idea: Short story concept (e.g., "Kabir woke up late for school")
-    
-    Returns:
-        Full story text (1-3 paragraphs, suitable for 6-panel comic)
-    """
-    retriever = load_retriever()
-    context = ""
-    
-    # Get character context from RAG
-    if retriever:
-        try:
-            docs = retriever.invoke(story_idea)
-            context = "\n\n".join([d.page_content for d in docs])
-        except Exception as e:
-            print(f"[WARN] RAG query failed: {e}")
-    
-    # Build prompt
-    prompt = f"""You are a creative storyteller for an all-ages comic strip.
+# Story prompt, filled with str.format per idea
+STORY_PROMPT_TEMPLATE = """You are a creative storyteller for an all-ages comic strip.
 
 CONTEXT (Characters and Settings):
-{context if context else "Use generic school characters and settings."}
+{context}
 
-STORY IDEA: {story_idea}
+STORY IDEA: {idea}
 
 REQUIREMENTS:
 1. Write a complete story (150-250 words) suitable for a 6-panel comic strip
@@ -63,13 +33,82 @@ REQUIREMENTS:
 
 Write the story now:"""
 
+def generate_story(story_idea: str) -> str:
+    """
+    Generate a complete, safe story from a short idea.
+    Synchronous wrapper around generate_story_async.
+    
+    Args:
+        story_idea: Short story concept (e.g., "Kabir woke up late for school")
+    
+    Returns:
+        Full story text (1-3 paragraphs, suitable for 6-panel comic)
+    """
+    return async_runner.run_sync(generate_story_async(story_idea))
+
+def stream_story(story_idea: str):
+    """
+    Stream a story as it is generated, for progressive display in the UI.
+    Synchronous wrapper around stream_story_async.
+    
+    Args:
+        story_idea: Short story concept (e.g., "Kabir woke up late for school")
+    
+    Yields:
+        Story text chunks in order
+    """
+    yield from async_runner.iter_sync(stream_story_async(story_idea))
+
+async def generate_story_async(story_idea: str) -> str:
+    """
+    Generate a complete, safe story from a short idea without blocking the event loop.
+    
+    Args:
+        story_idea: Short story concept (e.g., "Kabir woke up late for school")
+    
+    Returns:
+        Full story text (1-3 paragraphs, suitable for 6-panel comic)
+    """
+    chunks = [chunk async for chunk in stream_story_async(story_idea)]
+    return "".join(chunks).strip()
+
+async def stream_story_async(story_idea: str):
+    """
+    Generate a complete, safe story from a short idea, yielding text as Gemini streams it.
+    
+    Args:
+        story_idea: Short story concept (e.g., "Kabir woke up late for school")
+    
+    Yields:
+        Story text chunks in order
+    """
+    prompt = await _build_story_prompt(story_idea)
+    
+    stream = gemini_client.stream_async(_MODEL, prompt)
     try:
-        model = genai.GenerativeModel(config.GEMINI_MODEL)
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        async with contextlib.aclosing(stream):
+            async for text in stream:
+                yield text
     except Exception as e:
         raise Exception(f"Story generation failed: {e}")
 
+async def _build_story_prompt(story_idea: str) -> str:
+    """Retrieve character context and build the story generation prompt"""
+    context = ""
+    
+    # Get character context from RAG
+    try:
+        docs = await rag_shared.retrieve_async(story_idea, k=5)
+        context = rag_shared.build_context(docs)
+    except Exception as e:
+        print(f"[WARN] RAG query failed: {e}")
+    
+    # Build prompt
+    return STORY_PROMPT_TEMPLATE.format(
+        context=context or NO_CONTEXT_FALLBACK,
+        idea=story_idea
+    )
+
 if __name__ == "__main__":
     # Test
     test_idea = "Kabir tries to sneak a puppy into class"
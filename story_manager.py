@@ -1,43 +1,157 @@
 """
 Story Manager Module
-Handles saving, loading, and deleting stories on disk and in RAG.
+Handles saving, loading, and deleting stories in the story database and in RAG.
 """
 import os
-import json
-import uuid
-from datetime import datetime
+import time
+import logging
+import sqlite3
+import secrets
+import threading
+from datetime import datetime, timezone
 import config
+import fast_json
 import rag_index
 
-def get_all_stories() -> list:
+log = logging.getLogger(__name__)
+
+_UTC = timezone.utc
+
+# One shared connection (autocommit, WAL); sqlite3 objects are not thread-safe, so all use holds _DB_LOCK
+_conn = None
+_DB_LOCK = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    content TEXT,
+    created_at TEXT,
+    json_blob TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stories_created_at ON stories (created_at);
+"""
+
+def _get_conn() -> sqlite3.Connection:
+    """Open the story database once per process (caller holds _DB_LOCK)"""
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(config.STORIES_DB) or ".", exist_ok=True)
+        conn = sqlite3.connect(config.STORIES_DB, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={'FULL' if config.STORIES_FSYNC else 'NORMAL'}")
+        conn.executescript(_SCHEMA)
+        _migrate_json_stories(conn)
+        _conn = conn
+    return _conn
+
+def _migrate_json_stories(conn: sqlite3.Connection):
+    """
+    Import the legacy one-JSON-file-per-story layout on first use.
+    Runs once per database (tracked with PRAGMA user_version); the JSON files are left in place.
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= 1:
+        return
+    
+    rows = []
+    try:
+        with os.scandir(config.STORIES_DIR) as entries:
+            for entry in entries:
+                if not (entry.name.endswith('.json') and entry.is_file(follow_symlinks=False)):
+                    continue
+                try:
+                    story_data = fast_json.load_file(entry.path)
+                    # Legacy files hold naive local times; new stories are saved in UTC
+                    if story_data.get("created_at"):
+                        story_data["created_at"] = _to_utc(story_data["created_at"])
+                    rows.append(_story_row(story_data))
+                except Exception as e:
+                    log.warning("Failed to migrate story %s: %s", entry.name, e)
+    except FileNotFoundError:
+        pass
+    
+    conn.execute("BEGIN")
+    conn.executemany("INSERT OR IGNORE INTO stories VALUES (?, ?, ?, ?, ?)", rows)
+    conn.execute("PRAGMA user_version = 1")
+    conn.execute("COMMIT")
+    if rows:
+        log.info("Migrated %d JSON stories into %s", len(rows), config.STORIES_DB)
+
+def _to_utc(timestamp: str) -> str:
+    """Convert an ISO timestamp to UTC (naive values are taken as local time); unparseable values are kept"""
+    try:
+        return datetime.fromisoformat(timestamp).astimezone(_UTC).isoformat()
+    except ValueError:
+        return timestamp
+
+def _story_row(story_data: dict) -> tuple:
+    """Column values for a story; the full dict is kept as JSON so extra fields survive"""
+    return (
+        story_data["id"],
+        story_data.get("title", ""),
+        story_data.get("content", ""),
+        story_data.get("created_at", ""),
+        fast_json.dumps(story_data).decode("utf-8")
+    )
+
+def get_all_stories(include_content: bool = False) -> list:
     """
     Get all saved stories sorted by date (newest first).
     
+    Args:
+        include_content: Return full stories; by default only id/title/created_at
+            are selected and story text is never read
+    
     Returns:
         List of story dictionaries
     """
-    stories = []
-    if not os.path.exists(config.STORIES_DIR):
-        os.makedirs(config.STORIES_DIR, exist_ok=True)
-        return stories
-        
-    for filename in os.listdir(config.STORIES_DIR):
-        if filename.endswith('.json'):
-            filepath = os.path.join(config.STORIES_DIR, filename)
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    story_data = json.load(f)
-                    stories.append(story_data)
-            except Exception as e:
-                print(f"[WARN] Failed to load story {filename}: {e}")
-    
-    # Sort by date (newest first)
-    stories.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-    return stories
+    return _select_stories(include_content)
+
+def get_recent_stories(k: int, include_content: bool = False) -> list:
+    """
+    Get the k most recent stories.
+    
+    Args:
+        k: Number of stories to return
+        include_content: Return full stories instead of metadata only
+    
+    Returns:
+        Up to k story dictionaries, newest first
+    """
+    return _select_stories(include_content, limit=k)
+
+def _select_stories(include_content: bool, limit: int = -1) -> list:
+    """Query stories newest first, either as full dicts or metadata columns only"""
+    if include_content:
+        with _DB_LOCK:
+            rows = _get_conn().execute(
+                "SELECT json_blob FROM stories ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [fast_json.loads(blob) for (blob,) in rows]
+    
+    with _DB_LOCK:
+        rows = _get_conn().execute(
+            "SELECT id, title, created_at FROM stories ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+    return [{"id": story_id, "title": title, "created_at": created_at} for story_id, title, created_at in rows]
+
+def get_story_content(story_id: str) -> str:
+    """
+    Load the full text of one story.
+    
+    Args:
+        story_id: ID of the story
+    
+    Returns:
+        Story text, or None if the story does not exist
+    """
+    with _DB_LOCK:
+        row = _get_conn().execute("SELECT content FROM stories WHERE id = ?", (story_id,)).fetchone()
+    return row[0] if row else None
 
 def save_story(story_text: str, title: str = None) -> dict:
     """
-    Save a story to disk and RAG.
+    Save a story to the story database and RAG.
     
     Args:
         story_text: Content of the story
@@ -46,15 +160,14 @@ def save_story(story_text: str, title: str = None) -> dict:
     Returns:
         The saved story dictionary
     """
-    if not os.path.exists(config.STORIES_DIR):
-        os.makedirs(config.STORIES_DIR, exist_ok=True)
-        
-    story_id = str(uuid.uuid4())
-    timestamp = datetime.now().isoformat()
+    # Time-ordered id: sorts by creation time; the random suffix avoids collisions
+    story_id = f"{time.time_ns():016x}{secrets.token_hex(4)}"
+    timestamp = datetime.now(_UTC).isoformat()
     
     if not title:
         # Generate title from first few words
-        title = " ".join(story_text.split()[:5]) + "..."
+        # (maxsplit stops scanning after the sixth word instead of splitting the whole story)
+        title = " ".join(story_text.split(None, 5)[:5]) + "..."
         
     story_data = {
         "id": story_id,
@@ -64,22 +177,19 @@ def save_story(story_text: str, title: str = None) -> dict:
         "type": "story"
     }
     
-    # Save to disk
-    filename = f"{story_id}.json"
-    filepath = os.path.join(config.STORIES_DIR, filename)
-    
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(story_data, f, indent=2)
+    # Save to the database (one INSERT)
+    with _DB_LOCK:
+        _get_conn().execute("INSERT INTO stories VALUES (?, ?, ?, ?, ?)", _story_row(story_data))
         
     # Add to RAG
     rag_index.add_story_to_index(story_text, metadata=story_data)
     
-    print(f"[✓] Story '{title}' saved and indexed.")
+    log.info("Story '%s' saved and queued for indexing.", title)
     return story_data
 
 def delete_story(story_id: str) -> bool:
     """
-    Delete a story from disk and RAG.
+    Delete a story from the story database, disk and RAG.
     
     Args:
         story_id: ID of the story to delete
@@ -87,27 +197,31 @@ def delete_story(story_id: str) -> bool:
     Returns:
         True if successful, False otherwise
     """
-    filename = f"{story_id}.json"
-    filepath = os.path.join(config.STORIES_DIR, filename)
-    
-    # Delete from disk
-    if os.path.exists(filepath):
-        try:
-            os.remove(filepath)
-        except Exception as e:
-            print(f"[ERR] Failed to delete file {filepath}: {e}")
-            return False
-    else:
-        print(f"[WARN] Story file {filepath} not found.")
+    # Delete from the database (one DELETE)
+    with _DB_LOCK:
+        deleted = _get_conn().execute("DELETE FROM stories WHERE id = ?", (story_id,)).rowcount
+    if not deleted:
+        log.warning("Story %s not found in %s.", story_id, config.STORIES_DB)
+    
+    # Remove the legacy JSON file too, if this story predates the database
+    filepath = os.path.join(config.STORIES_DIR, f"{story_id}.json")
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        pass  # Stories saved after the database move have no JSON file
+    except OSError as e:
+        log.error("Failed to delete file %s: %s", filepath, e)
+        return False
         
     # Delete from RAG
     rag_index.delete_document(story_id)
     
-    print(f"[✓] Story {story_id} deleted.")
+    log.info("Story %s deleted.", story_id)
     return True
 
 if __name__ == "__main__":
     # Test
+    logging.basicConfig(level=logging.INFO)
     s = save_story("Once upon a time in Gandhinagar...", "Test Story")
     print(f"Saved: {s['id']}")
     stories = get_all_stories()